@@ -3,10 +3,12 @@ import os
 import logging
 
 # --- CRITICAL STABILITY FIX ---
-# Prevent NumPy/PyTorch from using OpenMP threads which causes hangs in Flask
-os.environ["OMP_NUM_THREADS"] = "1"
-os.environ["MKL_NUM_THREADS"] = "1"
-os.environ["BcTOKENIZERS_PARALLELISM"] = "false"
+# Prevent NumPy/PyTorch from using OpenMP threads which causes hangs in Flask.
+# Must run before anything imports numpy/torch transitively; setdefault lets
+# deployments override via the environment.
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+os.environ.setdefault("MKL_NUM_THREADS", "1")
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
 
 from flask import Flask
 from flask_cors import CORS
@@ -16,6 +18,7 @@ import platform
 
 from models import db
 from config import Config
+from core import analytics
 from core.search_engine import SearchEngine
 from routes.search_routes import search_bp
 from routes.public_search_routes import public_search_bp
@@ -44,9 +47,13 @@ app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
 db.init_app(app)
 migrate = Migrate(app, db)
 
-with app.app_context():
-    db.create_all()
-    print("✓ SQLAlchemy tables created/verified")
+# Table creation costs an information_schema round-trip per process, which
+# multiplies across workers. Prefer `flask db upgrade`; set SKIP_DB_CREATE=1
+# once migrations are the source of truth.
+if os.getenv('SKIP_DB_CREATE') != '1':
+    with app.app_context():
+        db.create_all()
+        print("✓ SQLAlchemy tables created/verified")
 
 # CORS
 CORS(app, origins=[
@@ -64,6 +71,9 @@ CORS(app, origins=[
 search_engine = SearchEngine()
 app.search_engine = search_engine
 
+# Background analytics writer (batched PublicSearch/User updates)
+analytics.start(app)
+
 # Register blueprints
 app.register_blueprint(search_bp, url_prefix='/api')
 app.register_blueprint(public_search_bp, url_prefix='/api')
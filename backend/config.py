@@ -31,6 +31,10 @@ class Config:
     if platform.system() == "Darwin":
         INDEX_PATH = "data/index.faiss"
         METADATA_PATH = "data/metadata.db"
+        VECTORS_PATH = "data/vectors.f32"
+        TITLE_EMB_PATH = "data/title_embs.f32"
     else:
         INDEX_PATH = "/opt/we/data/index.faiss"
-        METADATA_PATH = "/opt/we/data/metadata.db"
\ No newline at end of file
+        METADATA_PATH = "/opt/we/data/metadata.db"
+        VECTORS_PATH = "/opt/we/data/vectors.f32"
+        TITLE_EMB_PATH = "/opt/we/data/title_embs.f32"
\ No newline at end of file
@@ -0,0 +1,126 @@
+"""
+Background analytics writer. /related used to upsert PublicSearch and bump
+user counters synchronously, paying a Postgres round-trip (and commit) per
+request for data the client never sees. Routes now enqueue a small tuple
+and a daemon thread batches the writes: rows for the same query collapse
+into one upsert with an aggregated count, and one commit covers the whole
+batch instead of one per request. The queue drops on overflow — analytics
+are best-effort by design.
+"""
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from sqlalchemy import text
+
+from models import db
+
+_QUEUE = queue.Queue(maxsize=10000)
+
+# Same server-side JSONB dedup appends as the /searches/public upsert, with
+# the count increment parameterized so grouped rows land in one statement.
+_UPSERT_SQL = text("""
+    INSERT INTO public_searches
+        (id, search_query, search_count, last_searched_at, created_at,
+         ip_addresses, user_agents, last_ip)
+    VALUES
+        (:id, :q, :n, :now, :now,
+         jsonb_build_array(CAST(:ip AS text)),
+         jsonb_build_array(CAST(:ua AS text)), :ip)
+    ON CONFLICT (search_query) DO UPDATE SET
+        search_count = public_searches.search_count + EXCLUDED.search_count,
+        last_searched_at = EXCLUDED.last_searched_at,
+        last_ip = EXCLUDED.last_ip,
+        ip_addresses = CASE
+            WHEN COALESCE(public_searches.ip_addresses, '[]'::jsonb) @> to_jsonb(CAST(:ip AS text))
+            THEN COALESCE(public_searches.ip_addresses, '[]'::jsonb)
+            ELSE COALESCE(public_searches.ip_addresses, '[]'::jsonb) || to_jsonb(CAST(:ip AS text))
+        END,
+        user_agents = CASE
+            WHEN COALESCE(public_searches.user_agents, '[]'::jsonb) @> to_jsonb(CAST(:ua AS text))
+            THEN COALESCE(public_searches.user_agents, '[]'::jsonb)
+            ELSE COALESCE(public_searches.user_agents, '[]'::jsonb) || to_jsonb(CAST(:ua AS text))
+        END
+""")
+
+_BUMP_USER_SQL = text("""
+    UPDATE users
+    SET total_searches = total_searches + :n, last_seen = :now
+    WHERE fingerprint = :fp
+""")
+
+
+def record_search(search_query, ip_address, user_agent, fingerprint=None):
+    """Queues one search for the background writer. Never blocks."""
+    try:
+        _QUEUE.put_nowait((search_query, ip_address, user_agent, fingerprint))
+    except queue.Full:
+        pass
+
+
+def start(app, batch_size=500, flush_interval=2.0):
+    """Starts the daemon writer thread. Call once at app init."""
+    thread = threading.Thread(
+        target=_drain, args=(app, batch_size, flush_interval),
+        name="we-analytics", daemon=True
+    )
+    thread.start()
+    return thread
+
+
+def _drain(app, batch_size, flush_interval):
+    while True:
+        # Block for the first item, then gather company for up to
+        # flush_interval so bursts commit together
+        items = [_QUEUE.get()]
+        deadline = time.monotonic() + flush_interval
+        while len(items) < batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                items.append(_QUEUE.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        _flush(app, items)
+
+
+def _flush(app, items):
+    # Collapse repeats: one upsert per distinct query, one counter bump
+    # per distinct user, carrying the latest ip/ua seen in the batch
+    by_query = {}
+    by_user = {}
+    for search_query, ip_address, user_agent, fingerprint in items:
+        entry = by_query.get(search_query)
+        if entry is None:
+            by_query[search_query] = [1, ip_address, user_agent]
+        else:
+            entry[0] += 1
+            entry[1] = ip_address
+            entry[2] = user_agent
+        if fingerprint:
+            by_user[fingerprint] = by_user.get(fingerprint, 0) + 1
+
+    now = datetime.utcnow()
+    with app.app_context():
+        try:
+            for search_query, (count, ip_address, user_agent) in by_query.items():
+                db.session.execute(_UPSERT_SQL, {
+                    'id': str(uuid.uuid4()),
+                    'q': search_query,
+                    'n': count,
+                    'ip': ip_address,
+                    'ua': user_agent,
+                    'now': now
+                })
+            for fingerprint, count in by_user.items():
+                db.session.execute(_BUMP_USER_SQL, {
+                    'fp': fingerprint, 'n': count, 'now': now
+                })
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Analytics flush failed ({len(items)} events dropped): {e}")
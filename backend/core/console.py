@@ -1,10 +1,36 @@
-import time
-import sys
+import logging
+import logging.handlers
+import queue
 from datetime import datetime
 
+# All console output goes through a QueueHandler: the request thread only
+# enqueues one pre-formatted record per event, and a background
+# QueueListener does the actual (locking, syscall-heavy) stream writes.
+# This keeps interleaved multi-line blocks intact under threaded Flask and
+# takes terminal IO off the request hot path.
+_log_queue = queue.SimpleQueue()
+
+log = logging.getLogger("we.console")
+log.setLevel(logging.INFO)
+log.propagate = False
+log.addHandler(logging.handlers.QueueHandler(_log_queue))
+
+_listener = logging.handlers.QueueListener(_log_queue, logging.StreamHandler())
+_listener.start()
+
+def restart_listener():
+    """
+    Re-arms the background log writer after fork(): the listener thread
+    lives only in the process that started it, so a preloading WSGI master
+    must call this from its post_fork hook or workers log nothing.
+    """
+    global _listener
+    _listener = logging.handlers.QueueListener(_log_queue, logging.StreamHandler())
+    _listener.start()
+
 class Console:
     """
-    Simple ANSI color logger to make the terminal output look like a 
+    Simple ANSI color logger to make the terminal output look like a
     hacker console / dashboard.
     """
     HEADER = '\033[95m'
@@ -24,19 +50,22 @@ class Console:
     @staticmethod
     def log_search(query, ip, context_size):
         t = Console.timestamp()
-        print(f"{Console.HEADER}[{t}] 🔍 SEARCH INITIATED{Console.ENDC}")
-        print(f"    ├─ Query:   {Console.OKCYAN}{Console.BOLD}'{query}'{Console.ENDC}")
-        print(f"    ├─ IP:      {ip}")
-        print(f"    └─ Context: {context_size} existing nodes")
+        log.info("\n".join([
+            f"{Console.HEADER}[{t}] 🔍 SEARCH INITIATED{Console.ENDC}",
+            f"    ├─ Query:   {Console.OKCYAN}{Console.BOLD}'{query}'{Console.ENDC}",
+            f"    ├─ IP:      {ip}",
+            f"    └─ Context: {context_size} existing nodes"
+        ]))
 
     @staticmethod
     def log_verification(raw_count, verified_count, time_taken):
         dropped = raw_count - verified_count
         color = Console.OKGREEN if verified_count > 0 else Console.WARNING
-        print(f"    ├─ {Console.OKBLUE}Vector Search:{Console.ENDC} {raw_count} raw candidates found ({time_taken:.3f}s)")
+        lines = [f"    ├─ {Console.OKBLUE}Vector Search:{Console.ENDC} {raw_count} raw candidates found ({time_taken:.3f}s)"]
         if dropped > 0:
-            print(f"    ├─ {Console.WARNING}Verification:{Console.ENDC}  Dropped {dropped} mismatches / ghosts")
-        print(f"    └─ {color}Result:{Console.ENDC}        {verified_count} confirmed semantically relevant")
+            lines.append(f"    ├─ {Console.WARNING}Verification:{Console.ENDC}  Dropped {dropped} mismatches / ghosts")
+        lines.append(f"    └─ {color}Result:{Console.ENDC}        {verified_count} confirmed semantically relevant")
+        log.info("\n".join(lines))
 
     @staticmethod
     def log_edges(cache_hits, calculated, total_needed, time_taken):
@@ -46,28 +75,29 @@ class Console:
         # Create a visual progress bar
         total = cache_hits + calculated
         if total == 0: total = 1
-        
+
         percent_cached = (cache_hits / total) * 10
         bar = "█" * int(percent_cached) + "░" * (10 - int(percent_cached))
-        
-        print(f"    ┌─ {Console.HEADER}⚡ CROSS-EDGE CONNECTIVITY{Console.ENDC}")
-        
+
+        lines = [f"    ┌─ {Console.HEADER}⚡ CROSS-EDGE CONNECTIVITY{Console.ENDC}"]
+
         if cache_hits > 0:
-            print(f"    │  Found {Console.OKGREEN}{cache_hits}{Console.ENDC} cached edges {Console.OKGREEN}[{bar}]{Console.ENDC}")
-        
+            lines.append(f"    │  Found {Console.OKGREEN}{cache_hits}{Console.ENDC} cached edges {Console.OKGREEN}[{bar}]{Console.ENDC}")
+
         if calculated > 0:
-            print(f"    │  Calculated {Console.WARNING}{calculated}/{total_needed}{Console.ENDC} missing vectors")
+            lines.append(f"    │  Calculated {Console.WARNING}{calculated}/{total_needed}{Console.ENDC} missing vectors")
         else:
-            print(f"    │  {Console.OKGREEN}100% Cache Hit{Console.ENDC} - No vector math required")
-            
-        print(f"    └─ Time: {time_taken:.3f}s")
+            lines.append(f"    │  {Console.OKGREEN}100% Cache Hit{Console.ENDC} - No vector math required")
+
+        lines.append(f"    └─ Time: {time_taken:.3f}s")
+        log.info("\n".join(lines))
 
     @staticmethod
     def log_success(msg):
-        print(f"{Console.OKGREEN}    ✓ {msg}{Console.ENDC}")
+        log.info(f"{Console.OKGREEN}    ✓ {msg}{Console.ENDC}")
 
     @staticmethod
     def log_error(msg):
-        print(f"{Console.FAIL}    ✕ ERROR: {msg}{Console.ENDC}")
+        log.info(f"{Console.FAIL}    ✕ ERROR: {msg}{Console.ENDC}")
 
-console = Console()
\ No newline at end of file
+console = Console()
@@ -1,8 +1,141 @@
 import numpy as np
+import faiss
+import heapq
 import time
-from sentence_transformers import util
-from models import db, CachedEdge
+from sqlalchemy import select, or_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from models import db, CachedEdge, CachedNodeScan, User
 from core.console import console
+import threading
+
+MODEL_VERSION = "all-MiniLM-L6-v2"
+
+# CachedEdge.score is stored as int16 = similarity * SCORE_SCALE
+SCORE_SCALE = 10000
+
+__all__ = ['calculate_cross_edges', 'calculate_global_cross_edges', 'get_titles', 'norm_ids', 'pack_pair']
+
+# Titles are immutable for a given index build, so cache id -> title per
+# process. Graph expansions revisit the same ids constantly; hits skip the
+# SQLite round-trip entirely. Cleared wholesale if it ever grows huge.
+_TITLE_CACHE = {}
+_TITLE_CACHE_LOCK = threading.Lock()
+_TITLE_CACHE_MAX = 200_000
+
+# SQLite's default variable limit is 999, and IN-list parse cost grows with
+# the list; keep each statement comfortably below the limit.
+SQL_IN_CHUNK = 500
+
+# Use exact pair_key lookups while the new x (new + existing) cross product
+# stays below this; beyond it, fall back to the per-node OR query.
+PAIR_LOOKUP_MAX = 20_000
+
+def norm_ids(xs):
+    """Single-pass int cast + dedup, preserving first-seen order."""
+    return list(dict.fromkeys(int(x) for x in xs))
+
+def pack_pair(source_id, target_id):
+    """Packs a canonical (min, max) id pair into one 64-bit key."""
+    if source_id > target_id:
+        source_id, target_id = target_id, source_id
+    return (source_id << 32) | target_id
+
+def get_titles(cursor, ids):
+    """Bulk id -> title lookup, fetching only cache misses from SQLite."""
+    with _TITLE_CACHE_LOCK:
+        missing = [i for i in ids if i not in _TITLE_CACHE]
+
+    if missing:
+        rows = []
+        for start in range(0, len(missing), SQL_IN_CHUNK):
+            part = missing[start:start + SQL_IN_CHUNK]
+            placeholders = ','.join('?' * len(part))
+            cursor.execute(f"SELECT article_id, title FROM articles WHERE article_id IN ({placeholders})", part)
+            rows.extend(cursor.fetchall())
+
+        with _TITLE_CACHE_LOCK:
+            if len(_TITLE_CACHE) + len(rows) > _TITLE_CACHE_MAX:
+                _TITLE_CACHE.clear()
+            for row in rows:
+                _TITLE_CACHE[row['article_id']] = row['title']
+
+    with _TITLE_CACHE_LOCK:
+        return {i: _TITLE_CACHE[i] for i in ids if i in _TITLE_CACHE}
+
+def calculate_cross_edges(search_engine, candidate_ids, all_ids_to_check, threshold=0.62, max_edges_per_node=5):
+    """
+    Re-encoding variant used by the cluster test route.
+    Resolves titles for the union of candidates and targets, embeds each
+    unique title exactly ONCE (one batched encode, even when a node appears
+    on both sides), then links candidates to their above-threshold targets.
+    Returns title-keyed edges, no DB cache involved.
+    """
+    cand_ids = norm_ids(candidate_ids)
+    target_ids = norm_ids(all_ids_to_check)
+    union_ids = norm_ids(cand_ids + target_ids)
+
+    if len(union_ids) < 2:
+        return []
+
+    try:
+        cursor = search_engine.metadata_db.cursor()
+        id_to_title = get_titles(cursor, union_ids)
+    except Exception as e:
+        print(f"Title resolution error: {e}")
+        return []
+
+    # One encode call for every title we need — candidates that also appear
+    # as targets share the same embedding row instead of being encoded twice.
+    embed_ids = [nid for nid in union_ids if nid in id_to_title]
+    if len(embed_ids) < 2:
+        return []
+
+    titles = [id_to_title[nid].replace('_', ' ') for nid in embed_ids]
+    embeddings = search_engine.model.encode(
+        titles,
+        batch_size=64,
+        normalize_embeddings=True,
+        convert_to_numpy=True
+    ).astype(np.float32)
+
+    row_of = {nid: i for i, nid in enumerate(embed_ids)}
+    cand_rows = [row_of[c] for c in cand_ids if c in row_of]
+    tgt_rows = [row_of[t] for t in target_ids if t in row_of]
+
+    if not cand_rows or not tgt_rows:
+        return []
+
+    scores = embeddings[cand_rows] @ embeddings[tgt_rows].T
+
+    # Threshold + self-pair filtering run vectorized in C; the Python loop
+    # below only ever touches the surviving (candidate, target) pairs.
+    cand_arr = np.array([embed_ids[r] for r in cand_rows])
+    tgt_arr = np.array([embed_ids[r] for r in tgt_rows])
+    mask = scores > threshold
+    mask &= cand_arr[:, None] != tgt_arr[None, :]
+
+    edges = []
+    seen_pairs = set()
+
+    for i, c_id in enumerate(cand_arr):
+        cols = np.flatnonzero(mask[i])
+        if cols.size == 0:
+            continue
+        c_id = int(c_id)
+        row = [(float(scores[i, j]), int(tgt_arr[j])) for j in cols]
+
+        for score_val, t_id in heapq.nlargest(max_edges_per_node, row):
+            pair = tuple(sorted((c_id, t_id)))
+            if pair in seen_pairs:
+                continue
+            seen_pairs.add(pair)
+            edges.append({
+                "source": id_to_title[c_id],
+                "target": id_to_title[t_id],
+                "score": score_val
+            })
+
+    return edges
 
 def calculate_global_cross_edges(search_engine, new_node_ids, existing_node_ids, threshold=0.62, max_edges_per_node=5, user_context=None):
     """
@@ -17,9 +150,12 @@ def calculate_global_cross_edges(search_engine, new_node_ids, existing_node_ids,
     if not new_node_ids:
         return []
 
-    # 1. Normalize Inputs
-    new_ids_set = set(int(nid) for nid in new_node_ids)
-    existing_ids_set = set(int(nid) for nid in existing_node_ids if int(nid) not in new_ids_set)
+    # 1. Normalize Inputs (read-only from here on, so frozensets)
+    new_ids_set = frozenset(norm_ids(new_node_ids))
+    if not new_ids_set:
+        return []
+
+    existing_ids_set = frozenset(nid for nid in norm_ids(existing_node_ids) if nid not in new_ids_set)
     
     combined_edges = {} 
     resolved_nodes = set()
@@ -34,11 +170,27 @@ def calculate_global_cross_edges(search_engine, new_node_ids, existing_node_ids,
     try:
         if new_ids_set:
             new_ids_list = list(new_ids_set)
-            
-            cached_results = CachedEdge.query.filter(
-                (CachedEdge.source_id.in_(new_ids_list)) | 
-                (CachedEdge.target_id.in_(new_ids_list))
-            ).all()
+            union_pool = new_ids_set | existing_ids_set
+
+            # Read-only lookup: select just the three columns as plain rows
+            # instead of hydrating tracked ORM objects.
+            edge_cols = select(CachedEdge.source_id, CachedEdge.target_id, CachedEdge.score)
+
+            if len(new_ids_set) * len(union_pool) <= PAIR_LOOKUP_MAX:
+                # Small pools: look up the exact candidate pairs via the
+                # single-column pair_key index.
+                pair_keys = {
+                    pack_pair(a, b)
+                    for a in new_ids_set for b in union_pool if a != b
+                }
+                stmt = edge_cols.where(CachedEdge.pair_key.in_(list(pair_keys)))
+            else:
+                stmt = edge_cols.where(or_(
+                    CachedEdge.source_id.in_(new_ids_list),
+                    CachedEdge.target_id.in_(new_ids_list)
+                ))
+
+            cached_results = db.session.execute(stmt).all()
 
             cache_hits_count = len(cached_results)
 
@@ -54,9 +206,22 @@ def calculate_global_cross_edges(search_engine, new_node_ids, existing_node_ids,
                 
                 if is_relevant:
                     edge_key = tuple(sorted([row.source_id, row.target_id]))
-                    combined_edges[edge_key] = row.score
+                    combined_edges[edge_key] = row.score / SCORE_SCALE
                     resolved_nodes.add(node_id)
-            
+
+            # Negative cache: nodes already scanned under this model version
+            # are resolved even if they produced zero edges. Known miss: the
+            # scan only covered that request's pool, so a pair of nodes
+            # scanned in disjoint pools never gets computed from either
+            # side — accepted trade-off, see CachedNodeScan's docstring.
+            scanned = db.session.execute(
+                select(CachedNodeScan.node_id).where(
+                    CachedNodeScan.node_id.in_(new_ids_list),
+                    CachedNodeScan.model_version == MODEL_VERSION
+                )
+            ).scalars().all()
+            resolved_nodes.update(scanned)
+
     except Exception as e:
         print(f"Warning: DB Cache lookup failed: {e}")
 
@@ -78,17 +243,34 @@ def calculate_global_cross_edges(search_engine, new_node_ids, existing_node_ids,
     if search_engine.can_reconstruct and nodes_to_compute:
         try:
             def get_vectors(node_ids):
-                vecs = []
-                valid = []
-                for nid in node_ids:
-                    try:
-                        v = search_engine.index.reconstruct(nid)
-                        vecs.append(v)
-                        valid.append(nid)
-                    except:
-                        continue
-                if not vecs: return None, []
-                return np.array(vecs), valid
+                # Validate ids up front instead of paying a try/except per id,
+                # then pull everything in one batched reconstruct call.
+                # Reconstruction always goes through the CPU handle — a
+                # GPU-wrapped search index can't reconstruct.
+                index = getattr(search_engine, 'cpu_index', search_engine.index)
+                ntotal = index.ntotal
+                valid = [nid for nid in node_ids if 0 <= nid < ntotal]
+                if not valid: return None, []
+
+                if search_engine.vector_store is not None:
+                    # mmap'd normalized dump: fancy-indexing copies the rows
+                    # straight out of the page cache, no FAISS decode at all
+                    vecs = np.array(search_engine.vector_store[valid], dtype=np.float32)
+                    return vecs, valid
+
+                d = index.d
+                vecs = np.empty((len(valid), d), dtype=np.float32)
+                try:
+                    ids_arr = np.asarray(valid, dtype=np.int64)
+                    index.reconstruct_batch(ids_arr, vecs)
+                except AttributeError:
+                    # FAISS < 1.7.4 has no reconstruct_batch; fill the same buffer row by row
+                    for i, nid in enumerate(valid):
+                        vecs[i] = index.reconstruct(nid)
+
+                # Normalize in place so cosine similarity below is a plain dot product
+                faiss.normalize_L2(vecs)
+                return vecs, valid
 
             # Fetch vectors ONLY for cache misses
             new_vecs, new_valid = get_vectors(nodes_to_compute)
@@ -102,77 +284,98 @@ def calculate_global_cross_edges(search_engine, new_node_ids, existing_node_ids,
 
             edges_to_save = []
 
-            def extract_edges(source_ids, target_ids, matrix):
-                rows, cols = matrix.shape
-                
-                for i in range(rows):
-                    source_id = source_ids[i]
-                    scores = matrix[i]
-                    
-                    valid_indices = np.where(scores > threshold)[0]
-                    if len(valid_indices) == 0: continue
-
-                    valid_scores = scores[valid_indices]
-                    sorted_order = np.argsort(valid_scores)[::-1]
-                    top_indices = valid_indices[sorted_order]
-
-                    count = 0
-                    for idx in top_indices:
-                        if count >= max_edges_per_node: break
-                        target_id = target_ids[idx]
-                        if source_id == target_id: continue
+            def extract_edges(source_ids, source_vecs, target_ids, target_vecs):
+                # Vectors are pre-normalized, so FAISS range_search on an
+                # inner-product index returns exactly the above-threshold
+                # cosine pairs (CSR layout) without ever materializing the
+                # full |sources| x |targets| similarity matrix.
+                tmp_index = faiss.IndexFlatIP(target_vecs.shape[1])
+                tmp_index.add(target_vecs)
+                lims, scores, hits = tmp_index.range_search(source_vecs, threshold)
 
+                for i, source_id in enumerate(source_ids):
+                    row = [
+                        (float(scores[k]), target_ids[int(hits[k])])
+                        for k in range(lims[i], lims[i + 1])
+                        if target_ids[int(hits[k])] != source_id
+                    ]
+
+                    # range_search already filtered to above-threshold hits,
+                    # so most rows are at or under budget and need no selection
+                    if len(row) > max_edges_per_node:
+                        top = heapq.nlargest(max_edges_per_node, row)
+                    else:
+                        top = sorted(row, reverse=True)
+
+                    for score_val, target_id in top:
                         s_id, t_id = sorted([source_id, target_id])
                         edge_key = (s_id, t_id)
-                        score_val = float(scores[idx])
 
                         if edge_key not in combined_edges:
                             combined_edges[edge_key] = score_val
                             edges_to_save.append({
                                 'source_id': int(s_id),
                                 'target_id': int(t_id),
+                                'pair_key': pack_pair(int(s_id), int(t_id)),
                                 'score': score_val
                             })
-                        count += 1
 
             # 1. Missing vs Missing
             if new_vecs is not None and len(new_valid) > 1:
-                mat = util.cos_sim(new_vecs, new_vecs).cpu().numpy()
-                extract_edges(new_valid, new_valid, mat)
+                extract_edges(new_valid, new_vecs, new_valid, new_vecs)
 
             # 2. Missing vs Context
             if new_vecs is not None and context_vecs is not None:
-                mat = util.cos_sim(new_vecs, context_vecs).cpu().numpy()
-                extract_edges(new_valid, context_valid, mat)
+                extract_edges(new_valid, new_vecs, context_valid, context_vecs)
 
             # ---------------------------------------------------------
             # STEP C: Persist with Provenance
             # ---------------------------------------------------------
-            if edges_to_save:
+            if edges_to_save or new_valid:
                 try:
                     edges_added_count = 0
-                    
-                    for edge_data in edges_to_save:
-                        exists = CachedEdge.query.filter_by(
-                            source_id=edge_data['source_id'], 
-                            target_id=edge_data['target_id']
-                        ).first()
-                        
-                        if not exists:
-                            new_edge = CachedEdge(
-                                source_id=edge_data['source_id'],
-                                target_id=edge_data['target_id'],
-                                score=edge_data['score'],
-                                # Provenance Data
-                                model_version="all-MiniLM-L6-v2",
-                                created_by_user_id=user_context.id if user_context else None
+
+                    if edges_to_save:
+                        # Single bulk upsert instead of one SELECT round-trip per
+                        # edge; the (source_id, target_id) primary key handles
+                        # dedup server-side, which also removes the
+                        # read-before-write race between concurrent requests.
+                        for edge_data in edges_to_save:
+                            edge_data['score'] = int(round(edge_data['score'] * SCORE_SCALE))
+                            # Provenance Data
+                            edge_data['model_version'] = MODEL_VERSION
+                            edge_data['created_by_user_id'] = user_context.id if user_context else None
+
+                        stmt = pg_insert(CachedEdge).values(edges_to_save).on_conflict_do_nothing(
+                            index_elements=['source_id', 'target_id']
+                        )
+                        result = db.session.execute(stmt)
+                        edges_added_count = max(result.rowcount, 0)
+
+                    # Record every freshly scanned node — including ones with
+                    # zero above-threshold edges — so the negative cache in
+                    # STEP A skips them next time.
+                    if new_valid:
+                        scan_rows = [
+                            {'node_id': int(nid), 'model_version': MODEL_VERSION}
+                            for nid in new_valid
+                        ]
+                        db.session.execute(
+                            pg_insert(CachedNodeScan).values(scan_rows).on_conflict_do_nothing(
+                                index_elements=['node_id', 'model_version']
                             )
-                            db.session.add(new_edge)
-                            edges_added_count += 1
-                    
+                        )
+
+                    # Server-side increment by id: user_context may be a
+                    # detached proxy from the route's user cache, not a
+                    # session-attached ORM row.
                     if user_context and edges_added_count > 0:
-                        user_context.edges_discovered += edges_added_count
-                        
+                        db.session.execute(
+                            update(User)
+                            .where(User.id == user_context.id)
+                            .values(edges_discovered=User.edges_discovered + edges_added_count)
+                        )
+
                     db.session.commit()
                 except Exception as e:
                     db.session.rollback()
@@ -186,26 +389,19 @@ def calculate_global_cross_edges(search_engine, new_node_ids, existing_node_ids,
     # ---------------------------------------------------------
     # STEP D: Resolve Titles
     # ---------------------------------------------------------
+    # Pure cache-miss-with-no-hits path: don't touch the metadata DB at all
+    if not combined_edges:
+        return []
+
     final_output = []
     needed_ids = set()
     for (src, tgt) in combined_edges.keys():
         needed_ids.add(src)
         needed_ids.add(tgt)
-    
-    if not needed_ids:
-        return []
 
     try:
         cursor = search_engine.metadata_db.cursor()
-        id_to_title = {}
-        
-        id_list = list(needed_ids)
-        placeholders = ','.join('?' * len(id_list))
-        sql = f"SELECT article_id, title FROM articles WHERE article_id IN ({placeholders})"
-        cursor.execute(sql, id_list)
-        
-        for row in cursor.fetchall():
-            id_to_title[row['article_id']] = row['title']
+        id_to_title = get_titles(cursor, list(needed_ids))
 
         for (src, tgt), score in combined_edges.items():
             if src in id_to_title and tgt in id_to_title:
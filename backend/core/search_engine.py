@@ -1,9 +1,75 @@
 import faiss
+import numpy as np
+import os
+import queue
 import sqlite3
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
 from sentence_transformers import SentenceTransformer
 from flask import current_app
 from config import Config
 
+class _BatchedSearcher:
+    """
+    Coalesces concurrent single-query FAISS searches into one batched
+    index.search call. Under concurrent load, many 1 x d searches serialize
+    through the index and waste the memory traffic FAISS amortizes over
+    batch rows; stacking whatever is pending into one (B, d) call scales
+    throughput with batch size. A lone request pays no extra latency: the
+    worker only drains what is already queued, it never waits for company.
+    """
+
+    def __init__(self, engine, max_batch=32, timeout=30.0):
+        self._engine = engine
+        self._max_batch = max_batch
+        self._timeout = timeout
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._spawn_lock = threading.Lock()
+
+    def _ensure_worker(self):
+        # Lazy spawn + respawn keeps the batcher fork-safe: threads don't
+        # survive fork(), so under a preloading WSGI master each worker
+        # process restarts its own drain thread on first search
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._spawn_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._worker, name="we-faiss-batch", daemon=True
+                )
+                self._thread.start()
+
+    def search(self, embedding, k):
+        """Drop-in for index.search(embedding, k) with a (1, d) query."""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((np.ascontiguousarray(embedding, dtype=np.float32), k, future))
+        # Bounded wait: if the drain thread is ever missing, surface an
+        # error instead of hanging the request until the server kills it
+        return future.result(timeout=self._timeout)
+
+    def _worker(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self._max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                stacked = np.vstack([emb for emb, _, _ in batch])
+                max_k = max(k for _, k, _ in batch)
+                distances, indices = self._engine.index.search(stacked, max_k)
+                for j, (_, k, future) in enumerate(batch):
+                    future.set_result((distances[j:j + 1, :k], indices[j:j + 1, :k]))
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
 class SearchEngine:
     def __init__(self):
         print("="*80)
@@ -11,21 +77,87 @@ class SearchEngine:
         print("="*80)
         
         self.config = Config()
+        self._pin_threads()
         self._load_index()
+        self._load_vector_store()
+        self._load_title_embeddings()
         self._load_metadata_db()
+        self._load_title_map()
         self._load_model()
         self._verify_signals()
-        
+        self._load_signal_columns()
+
+        # Frozen per-process column lists: routes reuse these instead of
+        # rebuilding (and re-branching on) signal availability per request.
+        # Raw signal columns are only fetched where no precomputed
+        # normalized column covers them.
+        self.signal_columns = [
+            c for c in ('pagerank', 'pageviews') if self.available_signals[c]
+        ]
+        self.related_columns = ['article_id', 'title'] + [
+            c for c in self.signal_columns
+            if (c == 'pagerank' and self.pr_norm is None)
+            or (c == 'pageviews' and self.pv_norm is None)
+        ]
+        self.cluster_columns = ['article_id', 'title', 'lookup_title'] + self.signal_columns
+
+        # Encode and FAISS search both release the GIL in C, so routes can
+        # run an encode on this pool while doing DB work on the request
+        # thread (and vice versa across concurrent requests).
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="we-search")
+
+        # Concurrent single-query searches coalesce into batched FAISS calls
+        self._batcher = _BatchedSearcher(self)
+
+        self._warmup()
+
         print("\n" + "="*80)
         print("✓ API READY")
         print("="*80)
         self._print_config()
     
+    def _pin_threads(self):
+        """
+        Explicit thread budget for FAISS/torch so concurrent Flask worker
+        threads don't oversubscribe cores (context switches and cache
+        thrash dominate latency when every search spawns cpu_count OpenMP
+        threads). Defaults to the OMP_NUM_THREADS pin from app.py;
+        otherwise divides cores across WE_WEB_WORKERS processes.
+        """
+        per = int(os.getenv('OMP_NUM_THREADS', '0') or 0)
+        if per <= 0:
+            workers = max(1, int(os.getenv('WE_WEB_WORKERS', '1')))
+            per = max(1, (os.cpu_count() or 1) // workers)
+
+        faiss.omp_set_num_threads(per)
+        try:
+            import torch
+            torch.set_num_threads(per)
+        except ImportError:
+            pass
+        print(f"✓ Compute threads pinned: {per} per library")
+
     def _load_index(self):
         print("\nLoading FAISS index...")
         try:
-            self.index = faiss.read_index(self.config.INDEX_PATH)
-            print(f"✓ Index loaded: {self.index.ntotal} vectors")
+            self.index = None
+            # Mmap'd open keeps the codes file-backed: every worker process
+            # shares one copy through the OS page cache instead of holding
+            # its own in-RAM duplicate. Not every index type supports it;
+            # fall back to the in-memory read (WE_MMAP_INDEX=0 forces that).
+            if os.getenv('WE_MMAP_INDEX') != '0':
+                try:
+                    self.index = faiss.read_index(
+                        self.config.INDEX_PATH,
+                        faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+                    )
+                    print(f"✓ Index loaded (mmap): {self.index.ntotal} vectors")
+                except Exception as e:
+                    print(f"ℹ Mmap open unavailable ({e}); loading in-memory")
+
+            if self.index is None:
+                self.index = faiss.read_index(self.config.INDEX_PATH)
+                print(f"✓ Index loaded: {self.index.ntotal} vectors")
         except Exception as e:
             print(f"CRITICAL ERROR: Could not load index at {self.config.INDEX_PATH}")
             print(f"Error details: {e}")
@@ -35,13 +167,21 @@ class SearchEngine:
     
     def _configure_index(self):
         self.can_reconstruct = True
-        
+        # Cached downcast handle (None for flat indexes) so callers like
+        # /health read nprobe off it instead of re-downcasting per request
+        self.ivf_handle = None
+
         try:
             base_index = self.index.index if hasattr(self.index, 'index') else self.index
             ivf_index = faiss.downcast_index(base_index)
-            
+
             if hasattr(ivf_index, 'nprobe'):
-                ivf_index.nprobe = 32
+                # Operating point is deployment-tunable: run an offline
+                # recall sweep (scripts/test_search.py against a held-out
+                # query set) and pin the smallest nprobe that holds the
+                # recall target instead of shipping the blind default
+                ivf_index.nprobe = int(os.getenv('WE_NPROBE', '32') or 32)
+                self.ivf_handle = ivf_index
                 print(f"✓ IVF index configured (nprobe={ivf_index.nprobe})")
             
             if hasattr(ivf_index, 'make_direct_map'):
@@ -70,15 +210,213 @@ class SearchEngine:
             except:
                 self.can_reconstruct = False
                 print("⚠ Reconstruction not available - cross-edges disabled")
+
+        # Keep a CPU handle for reconstruction; GPU indexes can't reconstruct
+        self.cpu_index = self.index
+
+        # Optional GPU offload for the search path (faiss-gpu builds only)
+        try:
+            if hasattr(faiss, 'get_num_gpus') and faiss.get_num_gpus() > 0:
+                self._gpu_res = faiss.StandardGpuResources()
+                self.index = faiss.index_cpu_to_gpu(self._gpu_res, 0, self.index)
+                print("✓ Index moved to GPU 0")
+        except Exception as e:
+            print(f"ℹ GPU offload unavailable: {e}")
     
+    def _load_vector_store(self):
+        """
+        Optional mmap'd float32[ntotal][d] dump of the (normalized) corpus
+        vectors, built by scripts/build_vector_store.py. When present,
+        cross-edge vector fetches become page-cache reads instead of going
+        through FAISS's reconstruct/decode path.
+        """
+        self.vector_store = None
+        path = self.config.VECTORS_PATH
+
+        try:
+            if os.path.exists(path):
+                d = self.index.d
+                size = os.path.getsize(path)
+                # dtype is inferred from the file size: fp16 dumps halve the
+                # bytes read per vector fetch (built with --fp16)
+                if size == self.index.ntotal * d * 4:
+                    dtype = np.float32
+                elif size == self.index.ntotal * d * 2:
+                    dtype = np.float16
+                else:
+                    dtype = None
+                    print(f"⚠ Vector store size mismatch at {path} - ignoring (rebuild with scripts/build_vector_store.py)")
+
+                if dtype is not None:
+                    self.vector_store = np.memmap(path, dtype=dtype, mode='r', shape=(self.index.ntotal, d))
+                    print(f"✓ Vector store mapped: {self.index.ntotal} x {d} ({np.dtype(dtype).name})")
+        except Exception as e:
+            print(f"⚠ Vector store unavailable: {e}")
+
+    def _load_title_embeddings(self):
+        """
+        Optional mmap'd title-embedding store row-indexed by article_id,
+        built by scripts/build_title_embeddings.py. When present, /related's
+        verification layer gathers rows from it instead of re-encoding
+        candidate titles through the model on every request.
+        """
+        self.title_embs = None
+        d = self.index.d
+
+        # The dtype is recorded in the extension (.f32/.f16, matching what
+        # build_title_embeddings.py wrote) rather than sniffed from file
+        # size: an fp16 store with an even row count also divides evenly by
+        # d*4 and would silently map as float32 garbage at half the rows
+        base = os.path.splitext(self.config.TITLE_EMB_PATH)[0]
+        for path, dtype in ((base + '.f32', np.float32), (base + '.f16', np.float16)):
+            try:
+                if not os.path.exists(path):
+                    continue
+                itemsize = np.dtype(dtype).itemsize
+                size = os.path.getsize(path)
+                if size % (d * itemsize) != 0:
+                    print(f"⚠ Title embedding store size mismatch at {path} - ignoring")
+                    continue
+
+                rows = size // (d * itemsize)
+                self.title_embs = np.memmap(path, dtype=dtype, mode='r', shape=(rows, d))
+                print(f"✓ Title embeddings mapped: {rows} x {d} ({np.dtype(dtype).name})")
+                return
+            except Exception as e:
+                print(f"⚠ Title embedding store unavailable: {e}")
+
     def _load_metadata_db(self):
         print("\nLoading metadata database...")
-        self.metadata_db = sqlite3.connect(self.config.METADATA_PATH, check_same_thread=False)
-        self.metadata_db.row_factory = sqlite3.Row
+        self._db_local = threading.local()
+        # Open the startup thread's connection eagerly so a bad path fails fast
+        self._get_conn()
+
+    def _open_conn(self):
+        conn = sqlite3.connect(self.config.METADATA_PATH, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        # Read-mostly workload: WAL lets readers run concurrently, mmap skips
+        # read() syscalls, and a bigger page cache keeps hot index pages warm
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA mmap_size=1073741824")
+        cursor.execute("PRAGMA cache_size=-262144")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        # The API never writes to the metadata DB; query_only keeps these
+        # per-thread readers from ever taking a write lock, so concurrent
+        # request threads stay on the WAL no-blocking read path
+        cursor.execute("PRAGMA query_only=1")
+        return conn
+
+    def _get_conn(self):
+        conn = getattr(self._db_local, 'conn', None)
+        if conn is None:
+            conn = self._open_conn()
+            self._db_local.conn = conn
+        return conn
+
+    @property
+    def metadata_db(self):
+        """Per-thread SQLite connection so Flask threads don't serialize."""
+        return self._get_conn()
     
+    def _load_title_map(self):
+        """
+        In-RAM article_id -> title map. Lets routes drop meta pages before
+        the metadata SQL fetch, so the IN-list only carries survivors.
+        Set WE_SKIP_TITLE_MAP=1 to trade that for a smaller RSS.
+
+        Also derives meta_mask, a bool array indexed by article_id marking
+        meta pages. Meta-ness is fixed per title, so classifying once at
+        startup turns the per-candidate is_meta_page call in the routes
+        into one vectorized gather over the FAISS output.
+        """
+        self.titles = None
+        self.meta_mask = None
+        self.id_by_lookup = None
+        if os.getenv('WE_SKIP_TITLE_MAP') == '1':
+            return
+
+        try:
+            from core.ranking import is_meta_page
+
+            cursor = self.metadata_db.cursor()
+            cursor.row_factory = None
+            cursor.execute("SELECT article_id, title, lookup_title FROM articles")
+            rows = cursor.fetchall()
+            self.titles = {row[0]: row[1] for row in rows}
+
+            # Reverse map for lowercase-title -> id resolution: a dict hit
+            # beats even an indexed SQLite probe by a couple orders of
+            # magnitude, and the strings are shared with the rows above
+            self.id_by_lookup = {
+                (row[2] or row[1].lower()): row[0] for row in rows
+            }
+
+            mask = np.zeros(max(self.titles) + 1, dtype=bool)
+            for aid, title in self.titles.items():
+                if is_meta_page(title):
+                    mask[aid] = True
+            self.meta_mask = mask
+            print(f"✓ Title map loaded: {len(self.titles)} articles ({int(mask.sum())} meta)")
+        except Exception as e:
+            print(f"⚠ Title map unavailable: {e}")
+
     def _load_model(self):
         print("\nLoading sentence transformer model...")
         self.model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+        self.model.eval()
+        # Queries and titles are short; a tight cap shrinks attention padding
+        self.model.max_seq_length = 64
+
+        try:
+            import torch
+            if torch.cuda.is_available():
+                self.model = self.model.to('cuda').half()
+                print("✓ Model on GPU (fp16)")
+        except Exception as e:
+            print(f"ℹ GPU model placement skipped: {e}")
+
+        # Warmup forward pass so kernel compilation/caching happens at
+        # startup instead of on the first user query
+        self.model.encode(["warmup"], normalize_embeddings=True, convert_to_numpy=True)
+
+        # Query distributions are zipfian: memoize encodes as immutable
+        # bytes so popular queries skip the MiniLM forward pass entirely
+        @lru_cache(maxsize=10000)
+        def _encode_cached(text):
+            # asarray: no copy when the model already emits float32
+            emb = np.asarray(self.model.encode(
+                [text], normalize_embeddings=True, convert_to_numpy=True
+            ), dtype=np.float32)
+            return emb.tobytes(), emb.shape[1]
+
+        self._encode_cached = _encode_cached
+
+    def _warmup(self):
+        """
+        Dummy batched search so the first real query doesn't pay cold-start
+        costs: it touches the IVF centroid table and a spread of inverted
+        lists, faulting those pages into the OS cache. The model already
+        warms up in _load_model, and the startup title-map/signal scans
+        warm SQLite's pages.
+        """
+        try:
+            probe = np.zeros((8, self.index.d), dtype=np.float32)
+            self.index.search(probe, self.config.RESULTS_TO_RETURN)
+            print("✓ Index warmed up")
+        except Exception as e:
+            print(f"ℹ Index warmup skipped: {e}")
+
+    def search(self, embedding, k):
+        """Single-query search routed through the coalescing batcher."""
+        return self._batcher.search(embedding, k)
+
+    def encode_query(self, text):
+        """Cached single-query encode, returning a (1, d) float32 array."""
+        # Strip before keying so whitespace variants of a query share one
+        # cache slot (case is left alone: the model is case-sensitive)
+        buf, d = self._encode_cached(text.strip())
+        return np.frombuffer(buf, dtype=np.float32).reshape(1, d)
     
     def _verify_signals(self):
         cursor = self.metadata_db.cursor()
@@ -101,6 +439,57 @@ class SearchEngine:
         print(f"  Backlinks: {'✓' if self.available_signals['backlinks'] else '✗'}")
         print(f"  Cross-edges: {'✓' if self.can_reconstruct else '✗'}")
     
+    def _load_signal_columns(self):
+        """
+        Pre-normalized pagerank/pageview columns indexed by article_id.
+        Normalization is a pure function of the stored value, so doing it
+        once at startup turns the per-request normalize pass into a fancy-
+        indexed gather and lets routes drop the signal columns from their
+        candidate SQL fetch. Set WE_SKIP_SIGNAL_COLUMNS=1 to trade that
+        for a smaller RSS.
+        """
+        self.pr_norm = None
+        self.pv_norm = None
+        if os.getenv('WE_SKIP_SIGNAL_COLUMNS') == '1':
+            return
+
+        columns = [c for c in ('pagerank', 'pageviews') if self.available_signals[c]]
+        if not columns:
+            return
+
+        try:
+            from core.ranking import normalize_pagerank_vec, normalize_pageviews_vec
+
+            cursor = self.metadata_db.cursor()
+            cursor.row_factory = None
+            cursor.execute(f"SELECT article_id, {', '.join(columns)} FROM articles")
+            rows = cursor.fetchall()
+            if not rows:
+                return
+
+            ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+            size = int(ids.max()) + 1
+
+            if 'pagerank' in columns:
+                col = columns.index('pagerank') + 1
+                raw = np.zeros(size, dtype=np.float32)
+                raw[ids] = np.fromiter(
+                    ((r[col] or 0) for r in rows), dtype=np.float32, count=len(rows)
+                )
+                self.pr_norm = normalize_pagerank_vec(raw)
+
+            if 'pageviews' in columns:
+                col = columns.index('pageviews') + 1
+                raw = np.zeros(size, dtype=np.float32)
+                raw[ids] = np.fromiter(
+                    ((r[col] or 0) for r in rows), dtype=np.float32, count=len(rows)
+                )
+                self.pv_norm = normalize_pageviews_vec(raw)
+
+            print(f"✓ Normalized signal columns loaded: {', '.join(columns)} ({size} slots)")
+        except Exception as e:
+            print(f"⚠ Signal columns unavailable: {e}")
+
     def _print_config(self):
         print(f"\nRanking weights:")
         print(f"  Semantic similarity: {self.config.WEIGHT_SEMANTIC:.0%}")
@@ -0,0 +1,31 @@
+"""
+Gunicorn configuration. preload_app loads the FAISS index, model and
+metadata structures once in the master so workers share those pages
+copy-on-write — but daemon threads and pooled DB connections do not
+survive fork(), so the post_fork hook below restores them per worker.
+
+    WE_WEB_WORKERS=4 gunicorn -c gunicorn.conf.py wsgi:app
+"""
+import os
+
+bind = "0.0.0.0:5001"
+workers = int(os.getenv("WE_WEB_WORKERS", "4"))
+threads = 2
+preload_app = True
+timeout = 60
+
+
+def post_fork(server, worker):
+    # Restart everything fork() silently killed: the analytics drain
+    # thread and the console QueueListener live only in the master, and
+    # the SQLAlchemy pool created at import time must not be shared
+    # across processes. The FAISS batcher respawns itself lazily on
+    # first search, so it needs no hook here.
+    from app import app
+    from core import analytics, console
+    from models import db
+
+    with app.app_context():
+        db.engine.dispose()
+    analytics.start(app)
+    console.restart_listener()
@@ -0,0 +1,89 @@
+"""Cross-edge cache and analytics index schema changes
+
+Brings a pre-existing database (created by db.create_all() on the legacy
+models) up to the current models:
+
+- cached_edges: add + backfill the packed 64-bit pair_key, convert score
+  from float to scaled smallint (similarity * 10000), replace the btree
+  score index with a BRIN one, and drop the index that duplicated the
+  primary key
+- cached_node_scans: new negative-cache table keyed on
+  (node_id, model_version)
+- public_searches: descending indexes backing the popular/recent top-N
+  listings
+
+Fresh databases built via db.create_all() already match the models; run
+`flask db stamp head` on those instead of upgrading.
+
+Revision ID: 9f2a41c8d3b7
+Revises:
+Create Date: 2026-08-29
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9f2a41c8d3b7'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # --- cached_edges: packed pair key (add, backfill, unique index) ---
+    op.add_column('cached_edges', sa.Column('pair_key', sa.BigInteger(), nullable=True))
+    # Matches core.cross_edges.pack_pair: (min_id << 32) | max_id
+    op.execute("""
+        UPDATE cached_edges
+        SET pair_key = (CAST(LEAST(source_id, target_id) AS bigint) << 32)
+                       | GREATEST(source_id, target_id)
+        WHERE pair_key IS NULL
+    """)
+    op.create_index('ix_cached_edges_pair_key', 'cached_edges', ['pair_key'], unique=True)
+
+    # --- cached_edges: score float -> scaled smallint ---
+    op.execute("""
+        ALTER TABLE cached_edges
+        ALTER COLUMN score TYPE smallint
+        USING round(score * 10000)::smallint
+    """)
+
+    # --- cached_edges: BRIN score index, drop the PK-duplicate index ---
+    op.drop_index('idx_edge_score', table_name='cached_edges')
+    op.execute("CREATE INDEX idx_edge_score_brin ON cached_edges USING brin (score)")
+    op.drop_index('idx_edge_lookup', table_name='cached_edges')
+
+    # --- cached_node_scans: negative cache for zero-edge nodes ---
+    op.create_table(
+        'cached_node_scans',
+        sa.Column('node_id', sa.Integer(), nullable=False),
+        sa.Column('model_version', sa.String(length=50), nullable=False),
+        sa.Column('scanned_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('node_id', 'model_version')
+    )
+
+    # --- public_searches: descending top-N indexes ---
+    op.execute("CREATE INDEX ix_publicsearch_count_desc ON public_searches (search_count DESC)")
+    op.execute("CREATE INDEX ix_publicsearch_last_desc ON public_searches (last_searched_at DESC)")
+
+
+def downgrade():
+    op.drop_index('ix_publicsearch_last_desc', table_name='public_searches')
+    op.drop_index('ix_publicsearch_count_desc', table_name='public_searches')
+
+    op.drop_table('cached_node_scans')
+
+    op.create_index('idx_edge_lookup', 'cached_edges', ['source_id', 'target_id'])
+    op.drop_index('idx_edge_score_brin', table_name='cached_edges')
+    op.create_index('idx_edge_score', 'cached_edges', ['score'])
+
+    op.execute("""
+        ALTER TABLE cached_edges
+        ALTER COLUMN score TYPE double precision
+        USING score / 10000.0
+    """)
+
+    op.drop_index('ix_cached_edges_pair_key', table_name='cached_edges')
+    op.drop_column('cached_edges', 'pair_key')
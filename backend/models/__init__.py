@@ -39,24 +39,65 @@ class CachedEdge(db.Model):
 
     source_id = db.Column(db.Integer, nullable=False)
     target_id = db.Column(db.Integer, nullable=False)
-    score = db.Column(db.Float, nullable=False)
+    # Cosine similarity scaled by 1e4 (int16). The threshold decision only
+    # needs ~4 significant digits, and 2 bytes vs 8 per row keeps far more
+    # of the hot cache scan in the buffer pool.
+    score = db.Column(db.SmallInteger, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Canonical 64-bit pair key: (min_id << 32) | max_id.
+    # Lets small cache lookups hit a single B-tree index instead of a
+    # bitmap-OR over the source_id/target_id IN-lists.
+    pair_key = db.Column(db.BigInteger, unique=True, index=True, nullable=True)
     
     # Provenance
     model_version = db.Column(db.String(50), default="all-MiniLM-L6-v2", nullable=False)
     created_by_user_id = db.Column(UUID(as_uuid=True), db.ForeignKey('users.id'), nullable=True)
 
     # Composite Primary Key & Indexes
+    # Note: the primary key already backs (source_id, target_id) lookups;
+    # don't add a duplicate index on the same columns.
     __table_args__ = (
         db.PrimaryKeyConstraint('source_id', 'target_id'),
-        Index('idx_edge_lookup', 'source_id', 'target_id'),
-        Index('idx_edge_score', 'score'),
+        # BRIN: cached_edges is append-only, so block ranges stay well
+        # correlated and score range scans get a far smaller index
+        Index('idx_edge_score_brin', 'score', postgresql_using='brin'),
         Index('idx_edge_provenance', 'created_by_user_id', 'model_version')
     )
 
     def __repr__(self):
         return f'<Edge {self.source_id}-{self.target_id}: {self.score}>'
 
+class CachedNodeScan(db.Model):
+    """
+    Records that a node has been scanned for cross-edges under a given
+    model version. Without this, the edge cache cannot distinguish "computed,
+    nothing above threshold" from "never computed", so sparse nodes get
+    recomputed on every request.
+
+    Accepted trade-off: a scan only covers the request pool the node was
+    scanned against, not the full corpus. Two nodes each scanned in
+    disjoint pools will never have their pair computed from either side,
+    so an above-threshold edge between them can be permanently missed.
+    Given per-request pools of ~60 nodes against a multi-million-article
+    corpus, we take that miss rather than pay a corpus-wide range_search
+    per new node. Truncate this table to force a full recompute.
+    """
+    __tablename__ = 'cached_node_scans'
+
+    node_id = db.Column(db.Integer, nullable=False)
+    model_version = db.Column(db.String(50), default="all-MiniLM-L6-v2", nullable=False)
+    scanned_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Composite key: a node scanned under one model version must still be
+    # markable (not conflict-skipped) after a model-version bump
+    __table_args__ = (
+        db.PrimaryKeyConstraint('node_id', 'model_version'),
+    )
+
+    def __repr__(self):
+        return f'<NodeScan {self.node_id} ({self.model_version})>'
+
 class PublicSearch(db.Model):
     __tablename__ = 'public_searches'
     
@@ -71,7 +112,15 @@ class PublicSearch(db.Model):
     ip_addresses = db.Column(JSONB, default=list)
     user_agents = db.Column(JSONB, default=list)
     last_ip = db.Column(db.String(45))
-    
+
+    # Descending btree indexes backing the two ORDER BY ... LIMIT variants
+    # of /searches/public (popular and recent): top-N becomes an index
+    # range scan instead of a full-table sort
+    __table_args__ = (
+        Index('ix_publicsearch_count_desc', search_count.desc()),
+        Index('ix_publicsearch_last_desc', last_searched_at.desc()),
+    )
+
     def __repr__(self):
         return f'<PublicSearch {self.search_query}>'
     
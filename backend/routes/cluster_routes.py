@@ -1,37 +1,49 @@
 from flask import Blueprint, jsonify, request, current_app
-import networkx as nx
+import json
 import numpy as np
 import requests
+from functools import lru_cache
 from core.ranking import (
-    calculate_multisignal_score, 
-    normalize_pagerank,
-    normalize_pageviews,
-    is_meta_page
+    calculate_multisignal_score_batch,
+    is_meta_page_lower
 )
 from core.cross_edges import calculate_cross_edges
 
 cluster_bp = Blueprint('cluster', __name__)
 
+# Single round-trip replacement for the old 3-strategy lookup loop; the
+# CASE ordering preserves the strategy priority (exact > spaced > lookup).
+ROOT_LOOKUP_SQL = """
+    SELECT article_id, title FROM articles
+    WHERE title = ? OR title = ? OR lookup_title = ?
+    ORDER BY CASE WHEN title = ? THEN 1 WHEN title = ? THEN 2 ELSE 3 END
+    LIMIT 1
+"""
+
 def normalize_key(title):
     """Standardizes titles for ID lookup (case/underscore insensitive)"""
     if not title: return ""
     return title.replace('_', ' ').lower().strip()
 
+# Keep-alive session: repeat resolutions reuse the TCP/TLS connection.
+# User-Agent is often required by Wiki API to avoid blocking.
+_wiki_session = requests.Session()
+_wiki_session.headers['User-Agent'] = 'wikiExplorer-Test/1.0'
+
+@lru_cache(maxsize=10000)
 def resolve_wikipedia_title(query):
     """
     PORTED FROM frontend/src/lib/wikipedia.ts
     Resolves redirects (e.g., '5-HT2' -> '5-HT2 receptor') via Wikipedia API
-    so the vector search runs on the canonical title.
+    so the vector search runs on the canonical title. Memoized — redirects
+    are stable, so repeat queries never leave the process.
     """
     try:
         # Wikipedia API requires underscores for spaces in the URL path
         encoded_query = query.strip().replace(' ', '_')
         url = f"https://en.wikipedia.org/api/rest_v1/page/summary/{encoded_query}"
-        
-        # User-Agent is often required by Wiki API to avoid blocking
-        headers = {'User-Agent': 'wikiExplorer-Test/1.0'}
-        
-        response = requests.get(url, headers=headers, timeout=3)
+
+        response = _wiki_session.get(url, timeout=3)
         if response.status_code == 200:
             data = response.json()
             if 'title' in data:
@@ -71,27 +83,20 @@ def test_search_step():
     root_title = query
     exclude_id = None
 
-    lookup_strategies = [
-        ("SELECT article_id, title FROM articles WHERE title = ?", (query,)),
-        ("SELECT article_id, title FROM articles WHERE title = ?", (query.replace('_', ' '),)),
-        ("SELECT article_id, title FROM articles WHERE lookup_title = ?", (query.lower(),)),
-    ]
-    
-    for sql, params in lookup_strategies:
-        cursor.execute(sql, params)
-        row = cursor.fetchone()
-        if row:
-            root_id = int(row['article_id'])
-            root_title = row['title']
-            exclude_id = root_id
-            break
+    spaced = query.replace('_', ' ')
+    cursor.execute(ROOT_LOOKUP_SQL, (query, spaced, query.lower(), query, spaced))
+    row = cursor.fetchone()
+    if row:
+        root_id = int(row['article_id'])
+        root_title = row['title']
+        exclude_id = root_id
             
     if root_id == -1:
         # Fallback: if exact title isn't in our DB (but exists in Wiki),
         # use the vector of the CANONICAL title to find the closest match in our DB.
         try:
-            emb = search_engine.model.encode([query], normalize_embeddings=True)
-            D, I = search_engine.index.search(emb.astype(np.float32), 1)
+            emb = search_engine.encode_query(query)
+            D, I = search_engine.index.search(emb, 1)
             root_id = int(I[0][0])
             cursor.execute("SELECT title FROM articles WHERE article_id = ?", (root_id,))
             res = cursor.fetchone()
@@ -107,93 +112,157 @@ def test_search_step():
     try:
         # Use the CANONICAL title for embedding
         search_text = query.replace('_', ' ')
-        embedding = search_engine.model.encode(
-            [search_text], 
-            normalize_embeddings=True, 
-            convert_to_numpy=True
-        ).astype(np.float32)
+        embedding = search_engine.encode_query(search_text)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
     search_size = search_engine.config.CANDIDATE_POOL_SIZE + 1
     distances, indices = search_engine.index.search(embedding, search_size)
-    
-    candidate_ids = []
-    semantic_scores = {}
-    
-    for i, idx in enumerate(indices[0]):
-        idx_int = int(idx)
-        if idx_int >= 0 and idx_int != exclude_id:
-            candidate_ids.append(idx_int)
-            semantic_scores[idx_int] = float(distances[0][i])
+
+    # Vectorized filter over the FAISS results; scores stay a parallel
+    # array aligned with candidate_ids instead of a per-id dict
+    ids = indices[0]
+    mask = ids >= 0
+    if exclude_id is not None:
+        mask &= ids != exclude_id
+    # Meta pages drop as one gather against the startup-built mask
+    if search_engine.meta_mask is not None:
+        mm = search_engine.meta_mask
+        mask &= ~(mm[np.minimum(ids, mm.size - 1)] & (ids < mm.size))
+
+    candidate_ids = ids[mask].tolist()
+    semantic_scores = distances[0][mask]
 
     # ---------------------------------------------------------
     # 4. Fetch Metadata & Apply Weights
     # ---------------------------------------------------------
+    # Fallback pre-filter against the in-RAM title map so the SQL fetch
+    # below only pays row I/O for candidates that can actually rank
+    if search_engine.meta_mask is None and search_engine.titles is not None:
+        keep = [
+            i for i, c in enumerate(candidate_ids)
+            if c in search_engine.titles and not is_meta_page_lower(search_engine.titles[c].lower())
+        ]
+        candidate_ids = [candidate_ids[i] for i in keep]
+        semantic_scores = semantic_scores[keep]
+
     if not candidate_ids:
         return jsonify({'stats': [], 'debug_scores': []})
 
-    placeholders = ','.join('?' * len(candidate_ids))
-    query_columns = ['article_id', 'title']
-    if search_engine.available_signals['pagerank']:
-        query_columns.append('pagerank')
-    if search_engine.available_signals['pageviews']:
-        query_columns.append('pageviews')
-        
-    sql = f"SELECT {', '.join(query_columns)} FROM articles WHERE article_id IN ({placeholders})"
-    cursor.execute(sql, candidate_ids)
-    
-    results = []
-    data_map = {row['article_id']: row for row in cursor.fetchall()}
-    
-    for cand_id in candidate_ids:
-        row = data_map.get(cand_id)
-        if not row or is_meta_page(row['title']):
+    # lookup_title is the pre-lowered form; selecting it means each title is
+    # lowercased exactly once (in SQL at build time) instead of per check.
+    # The column list is frozen on the engine at startup.
+    query_columns = search_engine.cluster_columns
+    pr_col = query_columns.index('pagerank') if 'pagerank' in query_columns else -1
+    pv_col = query_columns.index('pageviews') if 'pageviews' in query_columns else -1
+
+    # json_each keeps the SQL text constant regardless of pool size, so
+    # sqlite3's statement cache skips the parse/plan on every request
+    sql = (
+        f"SELECT {', '.join(query_columns)} FROM articles "
+        "WHERE article_id IN (SELECT value FROM json_each(?))"
+    )
+    # Positional tuples: skips sqlite3.Row's per-access column-name scan
+    # across the whole pool (positions are fixed by the frozen column list)
+    meta_cursor = search_engine.metadata_db.cursor()
+    meta_cursor.row_factory = None
+    meta_cursor.execute(sql, (json.dumps(candidate_ids),))
+    rows = meta_cursor.fetchall()
+
+    # Align fetched rows to candidate positions without a dict: every row id
+    # is drawn from candidate_ids, so one searchsorted over the sorted
+    # candidate array recovers each row's position (and semantic score)
+    cand_arr = np.asarray(candidate_ids, dtype=np.int64)
+    cand_order = np.argsort(cand_arr)
+    row_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    row_pos = cand_order[np.searchsorted(cand_arr[cand_order], row_ids)]
+
+    # Collect the signal columns once, then score the whole pool in a
+    # single vectorized pass instead of one Python call per candidate.
+    kept_ids = []
+    sem_list, pr_list, pv_list, titles, titles_lower = [], [], [], [], []
+
+    for j, row in enumerate(rows):
+        title_lower = row[2] or row[1].lower()
+        if is_meta_page_lower(title_lower):
             continue
-            
-        semantic_score = semantic_scores.get(cand_id, 0.0)
-        
-        pagerank = row['pagerank'] if search_engine.available_signals['pagerank'] and 'pagerank' in row.keys() else 0
-        pageviews = row['pageviews'] if search_engine.available_signals['pageviews'] and 'pageviews' in row.keys() else 0
-        
-        # Calculate Weighted Score using Canonical Title
-        final_score = calculate_multisignal_score(
-            semantic_similarity=semantic_score,
-            pagerank_score=pagerank,
-            pageview_count=pageviews,
-            title=row['title'],
-            query=query 
+
+        pagerank = row[pr_col] if pr_col >= 0 else 0
+        pageviews = row[pv_col] if pv_col >= 0 else 0
+
+        kept_ids.append(int(row_ids[j]))
+        sem_list.append(float(semantic_scores[row_pos[j]]))
+        pr_list.append(pagerank or 0)
+        pv_list.append(pageviews or 0)
+        titles.append(row[1])
+        titles_lower.append(title_lower)
+
+    results = []
+    if kept_ids:
+        # Calculate Weighted Scores using Canonical Titles
+        final_scores = calculate_multisignal_score_batch(
+            sem_list, pr_list, pv_list, titles, query, titles_lower=titles_lower
         )
-        
-        results.append({
-            "id": cand_id,
-            "title": row['title'],
-            "final_score": final_score,
-            "debug": {
-                'sem': semantic_score,
-                'pr': pagerank, 
-                'pv': pageviews
-            }
-        })
+
+        for i, cand_id in enumerate(kept_ids):
+            results.append({
+                "id": cand_id,
+                "title": titles[i],
+                "final_score": float(final_scores[i]),
+                "debug": {
+                    'sem': sem_list[i],
+                    'pr': pr_list[i],
+                    'pv': pv_list[i]
+                }
+            })
 
     # ---------------------------------------------------------
     # 5. Sort and Graph Construction
     # ---------------------------------------------------------
-    results.sort(key=lambda x: x['final_score'], reverse=True)
-    top_28 = results[:28]
+    # Partial selection: partition out the top 28, then order just those,
+    # instead of fully sorting thousands of candidates
+    if len(results) > 28:
+        top_idx = np.argpartition(-final_scores, 28)[:28]
+        top_idx = top_idx[np.argsort(-final_scores[top_idx])]
+        top_28 = [results[i] for i in top_idx]
+    else:
+        top_28 = sorted(results, key=lambda x: x['final_score'], reverse=True)
 
-    G = nx.DiGraph()
-    G.add_node(root_id, label=root_title, depth=0)
-    
-    title_to_id = {}
+    # Plain index-based adjacency arrays instead of a NetworkX graph: the
+    # stats below reduce to bincounts and one scatter-add over the edges.
+    node_ids = [root_id] + [res['id'] for res in top_28]
+    node_labels = [root_title] + [res['title'] for res in top_28]
+    node_depths = [0] + [1] * len(top_28)
+    idx_of = {nid: i for i, nid in enumerate(node_ids)}
+
+    edge_src, edge_dst = [], []
+    edge_set = set()
+
+    def add_edge(u, v):
+        # title_to_id spans the whole candidate pool; only graph nodes count
+        if u not in idx_of or v not in idx_of:
+            return
+        iu, iv = idx_of[u], idx_of[v]
+        # Dedup on a packed int key instead of an id tuple: one small int
+        # per edge in the set rather than a tuple plus two boxed ints
+        key = (iu << 32) | iv
+        if key not in edge_set:
+            edge_set.add(key)
+            edge_src.append(iu)
+            edge_dst.append(iv)
+
+    # Titles are already lowered server-side (lookup_title), so the map is
+    # one dict comprehension with no per-entry normalize_key dispatch
+    title_to_id = {
+        (row[2] or row[1].lower()): row[0]
+        for row in rows
+    }
     title_to_id[normalize_key(root_title)] = root_id
-    
+
     child_ids = []
     for res in top_28:
         child_ids.append(res['id'])
-        G.add_node(res['id'], label=res['title'], depth=1)
-        G.add_edge(root_id, res['id'], weight=res['final_score'])
-        title_to_id[normalize_key(res['title'])] = res['id']
+        add_edge(root_id, res['id'])
 
     # ---------------------------------------------------------
     # 6. Cross Edge Calculation (Connectivity)
@@ -205,38 +274,47 @@ def test_search_step():
         cross_edges = calculate_cross_edges(search_engine, child_ids, all_ids_to_check)
         
         for edge in cross_edges:
-            src_key = normalize_key(edge['source'])
-            tgt_key = normalize_key(edge['target'])
-            
+            # Edge titles come straight from the DB, so a plain lower()
+            # lines up with the lookup_title-keyed map
+            src_key = edge['source'].lower()
+            tgt_key = edge['target'].lower()
+
             if src_key in title_to_id and tgt_key in title_to_id:
-                u = title_to_id[src_key]
-                v = title_to_id[tgt_key]
-                
-                if not G.has_edge(u, v):
-                    G.add_edge(u, v, weight=edge['score'])
+                add_edge(title_to_id[src_key], title_to_id[tgt_key])
 
     # ---------------------------------------------------------
     # 7. Generate Stats
     # ---------------------------------------------------------
-    stats = []
-    for nid in G.nodes():
-        node_title = G.nodes[nid]['label']
-        node_depth = G.nodes[nid]['depth']
-        in_deg = G.in_degree(nid)
-        out_deg = G.out_degree(nid)
-        conn = sum(G.degree(n) for n in G.neighbors(nid))
-        
-        stats.append({
-            'ARTICLE': node_title,
-            'DEPTH': node_depth,
-            'TOTAL EDGES': in_deg + out_deg,
-            'OUTGOING': out_deg,
-            'INCOMING': in_deg,
-            'NEIGHBOR CONN': conn,
-            'EXPANSIONS': 1 if nid == root_id else 0
-        })
-
-    stats.sort(key=lambda x: x['TOTAL EDGES'], reverse=True)
+    n_nodes = len(node_ids)
+    src = np.array(edge_src, dtype=np.int32)
+    dst = np.array(edge_dst, dtype=np.int32)
+
+    out_deg = np.bincount(src, minlength=n_nodes)
+    in_deg = np.bincount(dst, minlength=n_nodes)
+    total_deg = in_deg + out_deg
+
+    # Neighbor connectivity = sum of total degree over each node's
+    # neighbors in either direction, computed as two scatter-adds over
+    # the edge list (one per endpoint)
+    neighbor_conn = np.zeros(n_nodes, dtype=np.int64)
+    np.add.at(neighbor_conn, src, total_deg[dst])
+    np.add.at(neighbor_conn, dst, total_deg[src])
+
+    # Emit rows straight from the precomputed arrays in sorted order — the
+    # argsort replaces the Python key-function sort over dicts
+    order = np.argsort(-total_deg, kind='stable')
+    stats = [
+        {
+            'ARTICLE': node_labels[i],
+            'DEPTH': node_depths[i],
+            'TOTAL EDGES': int(total_deg[i]),
+            'OUTGOING': int(out_deg[i]),
+            'INCOMING': int(in_deg[i]),
+            'NEIGHBOR CONN': int(neighbor_conn[i]),
+            'EXPANSIONS': 1 if node_ids[i] == root_id else 0
+        }
+        for i in order
+    ]
 
     return jsonify({
         'stats': stats,
@@ -1,36 +1,33 @@
 from flask import Blueprint, jsonify, current_app
-import faiss
 
 health_bp = Blueprint('health', __name__)
 
 @health_bp.route('/health', methods=['GET'])
 def health_check():
     search_engine = current_app.search_engine
-    
-    try:
-        nprobe = faiss.downcast_index(search_engine.index.index).nprobe
-    except:
+
+    # Downcast handle is cached on the engine at startup; no per-request
+    # faiss.downcast_index re-wrap
+    if search_engine.ivf_handle is not None:
+        nprobe = search_engine.ivf_handle.nprobe
+    else:
         nprobe = "N/A (Flat Index)"
-    
+
     cursor = search_engine.metadata_db.cursor()
-    cursor.execute("SELECT COUNT(*) FROM articles")
-    total_articles = cursor.fetchone()[0]
-    
-    signal_coverage = {}
-    if search_engine.available_signals['pagerank']:
-        cursor.execute("SELECT COUNT(*) FROM articles WHERE pagerank > 0")
-        result = cursor.fetchone()
-        signal_coverage['pagerank'] = result[0] if result else 0
-    
-    if search_engine.available_signals['pageviews']:
-        cursor.execute("SELECT COUNT(*) FROM articles WHERE pageviews > 0")
-        result = cursor.fetchone()
-        signal_coverage['pageviews'] = result[0] if result else 0
-    
-    if search_engine.available_signals['backlinks']:
-        cursor.execute("SELECT COUNT(*) FROM articles WHERE backlinks > 0")
-        result = cursor.fetchone()
-        signal_coverage['backlinks'] = result[0] if result else 0
+
+    # One aggregated scan covers the row count and every available signal's
+    # coverage, instead of up to four separate passes over articles
+    agg_exprs = ["COUNT(*)"]
+    signal_names = []
+    for signal in ('pagerank', 'pageviews', 'backlinks'):
+        if search_engine.available_signals[signal]:
+            agg_exprs.append(f"SUM({signal} > 0)")
+            signal_names.append(signal)
+
+    cursor.execute(f"SELECT {', '.join(agg_exprs)} FROM articles")
+    row = cursor.fetchone()
+    total_articles = row[0]
+    signal_coverage = {name: int(row[i + 1] or 0) for i, name in enumerate(signal_names)}
     
     return jsonify({
         "status": "ok",
@@ -1,12 +1,43 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, request
+from core.jsonx import json_response
 from datetime import datetime
+import json
+import uuid
 from models import db, PublicSearch
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy import text
 
 public_search_bp = Blueprint('public_search', __name__)
 
-
-
+# Single-round-trip upsert. The JSONB appends run server-side (the arrays
+# never round-trip through Python), the conflict clause removes the
+# SELECT-then-write race, and RETURNING feeds the response without a
+# re-fetch. search_count = 1 in the returned row means the insert won.
+UPSERT_SEARCH_SQL = text("""
+    INSERT INTO public_searches
+        (id, search_query, graph_data, search_count, last_searched_at,
+         created_at, ip_addresses, user_agents, last_ip)
+    VALUES
+        (:id, :q, CAST(:graph AS jsonb), 1, :now, :now,
+         jsonb_build_array(CAST(:ip AS text)),
+         jsonb_build_array(CAST(:ua AS text)), :ip)
+    ON CONFLICT (search_query) DO UPDATE SET
+        search_count = public_searches.search_count + 1,
+        last_searched_at = EXCLUDED.last_searched_at,
+        last_ip = EXCLUDED.last_ip,
+        graph_data = COALESCE(EXCLUDED.graph_data, public_searches.graph_data),
+        ip_addresses = CASE
+            WHEN COALESCE(public_searches.ip_addresses, '[]'::jsonb) @> to_jsonb(CAST(:ip AS text))
+            THEN COALESCE(public_searches.ip_addresses, '[]'::jsonb)
+            ELSE COALESCE(public_searches.ip_addresses, '[]'::jsonb) || to_jsonb(CAST(:ip AS text))
+        END,
+        user_agents = CASE
+            WHEN COALESCE(public_searches.user_agents, '[]'::jsonb) @> to_jsonb(CAST(:ua AS text))
+            THEN COALESCE(public_searches.user_agents, '[]'::jsonb)
+            ELSE COALESCE(public_searches.user_agents, '[]'::jsonb) || to_jsonb(CAST(:ua AS text))
+        END
+    RETURNING id, search_query, graph_data, search_count,
+              last_searched_at, created_at
+""")
 
 @public_search_bp.route('/searches/public', methods=['POST'])
 def save_public_search():
@@ -15,7 +46,7 @@ def save_public_search():
     graph_data = data.get('graph_data')
     
     if not query:
-        return jsonify({'error': 'Query required'}), 400
+        return json_response({'error': 'Query required'}, 400)
     
     ip_address = request.headers.get('X-Forwarded-For', request.remote_addr)
     if ip_address and ',' in ip_address:
@@ -24,44 +55,30 @@ def save_public_search():
     user_agent = request.headers.get('User-Agent', 'Unknown')
     
     try:
-        existing = PublicSearch.query.filter_by(search_query=query).first()
-        
-        if existing:
-            existing.search_count += 1
-            existing.last_searched_at = datetime.utcnow()
-            existing.last_ip = ip_address
-            if graph_data:
-                existing.graph_data = graph_data
-            
-            if existing.ip_addresses is None:
-                existing.ip_addresses = []
-            if existing.user_agents is None:
-                existing.user_agents = []
-                
-            if ip_address not in existing.ip_addresses:
-                existing.ip_addresses = existing.ip_addresses + [ip_address]
-            if user_agent not in existing.user_agents:
-                existing.user_agents = existing.user_agents + [user_agent]
-                
-            db.session.commit()
-            return jsonify(existing.to_dict())
-        else:
-            new_search = PublicSearch(
-                search_query=query,
-                graph_data=graph_data,
-                search_count=1,
-                last_ip=ip_address,
-                ip_addresses=[ip_address],
-                user_agents=[user_agent]
-            )
-            db.session.add(new_search)
-            db.session.commit()
-            return jsonify(new_search.to_dict()), 201
-            
+        row = db.session.execute(UPSERT_SEARCH_SQL, {
+            'id': str(uuid.uuid4()),
+            'q': query,
+            'ip': ip_address,
+            'ua': user_agent,
+            'now': datetime.utcnow(),
+            'graph': json.dumps(graph_data) if graph_data else None
+        }).fetchone()
+        db.session.commit()
+
+        payload = {
+            'id': str(row.id),
+            'query': row.search_query,
+            'graph_data': row.graph_data,
+            'search_count': row.search_count,
+            'last_searched_at': row.last_searched_at.isoformat(),
+            'created_at': row.created_at.isoformat()
+        }
+        return json_response(payload, 201 if row.search_count == 1 else 200)
+
     except Exception as e:
         db.session.rollback()
         print(f"Error saving search: {e}")
-        return jsonify({'error': 'Failed to save search'}), 500
+        return json_response({'error': 'Failed to save search'}, 500)
 
 
 
@@ -77,7 +94,7 @@ def get_public_searches():
     else:
         searches = PublicSearch.query.order_by(PublicSearch.last_searched_at.desc()).limit(limit).all()
     
-    return jsonify([s.to_dict() for s in searches])
+    return json_response([s.to_dict() for s in searches])
 
 
 @public_search_bp.route('/searches/by-ip/<ip>', methods=['GET'])
@@ -87,7 +104,7 @@ def get_searches_by_ip(ip):
         PublicSearch.ip_addresses.contains([ip])
     ).order_by(PublicSearch.last_searched_at.desc()).all()
     
-    return jsonify({
+    return json_response({
         'ip': ip,
         'total_searches': len(searches),
         'queries': [s.to_dict() for s in searches]
@@ -104,6 +121,6 @@ def get_search_stats():
         func.sum(PublicSearch.search_count).label('total')
     ).group_by(PublicSearch.last_ip).order_by(func.sum(PublicSearch.search_count).desc()).limit(20).all()
     
-    return jsonify({
+    return json_response({
         'top_ips': [{'ip': ip, 'search_count': total} for ip, total in heavy_users]
     })
\ No newline at end of file
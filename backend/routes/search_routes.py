@@ -1,20 +1,24 @@
 from flask import Blueprint, jsonify, request, current_app
 import numpy as np
 import hashlib
+import threading
 import time
+from collections import OrderedDict
 from datetime import datetime
-from sqlalchemy.exc import IntegrityError
-from sentence_transformers import util
+from types import SimpleNamespace
+from functools import lru_cache
 
 from core.ranking import (
-    calculate_multisignal_score, 
-    normalize_pagerank, 
-    normalize_pageviews, 
+    calculate_multisignal_score_batch,
+    normalize_pagerank_vec,
+    normalize_pageviews_vec,
     is_meta_page
 )
+from core import analytics
 from core.cross_edges import calculate_global_cross_edges
 from core.console import console
-from models import db, PublicSearch, User
+from core.jsonx import json_response
+from models import db, User
 
 search_bp = Blueprint('search', __name__)
 
@@ -26,12 +30,115 @@ def get_client_info():
     ua = request.headers.get('User-Agent', 'Unknown')
     return ip, ua
 
+# Bounded LRU of title -> (384,) float32 embedding for the verification
+# layer. Popular articles surface in many candidate pools, so hits skip the
+# transformer forward entirely. ~50MB at capacity.
+_TITLE_EMB_CACHE = OrderedDict()
+_TITLE_EMB_LOCK = threading.Lock()
+_TITLE_EMB_MAX = 32768
+
+def _encode_titles_cached(search_engine, titles):
+    """
+    Returns a (len(titles), d) float32 matrix of normalized title
+    embeddings, encoding only cache misses (in one batch).
+    """
+    embeddings = [None] * len(titles)
+    misses, miss_pos = [], []
+
+    with _TITLE_EMB_LOCK:
+        for i, title in enumerate(titles):
+            cached = _TITLE_EMB_CACHE.get(title)
+            if cached is not None:
+                _TITLE_EMB_CACHE.move_to_end(title)
+                embeddings[i] = cached
+            else:
+                misses.append(title)
+                miss_pos.append(i)
+
+    if misses:
+        encoded = np.asarray(search_engine.model.encode(
+            misses, normalize_embeddings=True, convert_to_numpy=True
+        ), dtype=np.float32)
+
+        with _TITLE_EMB_LOCK:
+            for j, title in enumerate(misses):
+                _TITLE_EMB_CACHE[title] = encoded[j]
+                _TITLE_EMB_CACHE.move_to_end(title)
+            while len(_TITLE_EMB_CACHE) > _TITLE_EMB_MAX:
+                _TITLE_EMB_CACHE.popitem(last=False)
+
+        for j, pos in enumerate(miss_pos):
+            embeddings[pos] = encoded[j]
+
+    return np.stack(embeddings)
+
+def _padded_in(ids):
+    """
+    Pads an id list to the next power of two with -1 sentinels so the
+    IN-list SQL text is one of a handful of fixed shapes. sqlite3 caches
+    prepared statements by SQL text, so fixed shapes skip re-parsing the
+    query on every request.
+    """
+    n = 1
+    while n < len(ids):
+        n <<= 1
+    padded = list(ids) + [-1] * (n - len(ids))
+    return padded, ','.join('?' * n)
+
+@lru_cache(maxsize=8192)
+def _lookup_exclude_id(clean_query):
+    """
+    Memoized lowercase-title -> article_id lookup. lookup_title is the
+    pre-lowered column populated at ingest and indexed by
+    scripts/create_metadata_indexes.py, so this is one indexed equality
+    probe instead of a LOWER(title) table scan; the articles table is
+    static for the life of the process, so each distinct query pays it once.
+    """
+    cursor = current_app.search_engine.metadata_db.cursor()
+    cursor.execute("SELECT article_id FROM articles WHERE lookup_title = ?", (clean_query,))
+    row = cursor.fetchone()
+    return int(row['article_id']) if row else -1
+
+@lru_cache(maxsize=4096)
+def _fingerprint(ip, ua):
+    """
+    Memoized SHA-256 of ip|ua. The digest itself stays SHA-256 — the users
+    table is keyed on the stored 64-char hex values, so changing the hash
+    would orphan every existing row. Repeat visitors (the common case) just
+    reuse the cached digest instead of re-hashing per request.
+    """
+    return hashlib.sha256(f"{ip}|{ua}".encode()).hexdigest()
+
+# TTL cache of fingerprint -> user id. Repeat visitors are the common case
+# and their row already exists, so the SELECT + commit per request is a pure
+# re-read; cache hits return a detached proxy instead. last_seen still
+# advances via the analytics worker's batched per-user bump.
+_USER_CACHE = OrderedDict()
+_USER_CACHE_LOCK = threading.Lock()
+_USER_CACHE_MAX = 10000
+_USER_CACHE_TTL = 300.0
+
 def get_or_create_user():
-    """Identifies a user by a hash of their IP + UserAgent."""
+    """
+    Identifies a user by a hash of their IP + UserAgent.
+
+    Returns either a tracked User row (first sighting in this process) or a
+    lightweight detached proxy exposing the same fields the request path
+    reads (id, ip_address, user_agent, fingerprint). Callers must not
+    mutate ORM attributes on the result.
+    """
     ip, ua = get_client_info()
-    fingerprint_raw = f"{ip}|{ua}"
-    fingerprint = hashlib.sha256(fingerprint_raw.encode()).hexdigest()
-    
+    fingerprint = _fingerprint(ip, ua)
+
+    now = time.monotonic()
+    with _USER_CACHE_LOCK:
+        entry = _USER_CACHE.get(fingerprint)
+        if entry is not None and entry[1] > now:
+            _USER_CACHE.move_to_end(fingerprint)
+            return SimpleNamespace(
+                id=entry[0], ip_address=ip, user_agent=ua, fingerprint=fingerprint
+            )
+
     user = User.query.filter_by(fingerprint=fingerprint).first()
     if not user:
         user = User(
@@ -46,6 +153,13 @@ def get_or_create_user():
         db.session.add(user)
     else:
         user.last_seen = datetime.utcnow()
+    db.session.commit()
+
+    with _USER_CACHE_LOCK:
+        _USER_CACHE[fingerprint] = (user.id, now + _USER_CACHE_TTL)
+        _USER_CACHE.move_to_end(fingerprint)
+        while len(_USER_CACHE) > _USER_CACHE_MAX:
+            _USER_CACHE.popitem(last=False)
     return user
 
 @search_bp.route('/related', methods=['POST'])
@@ -53,10 +167,9 @@ def get_related():
     search_engine = current_app.search_engine
     cursor = search_engine.metadata_db.cursor()
     
-    # 1. User Session Management
+    # 1. User Session Management — a cache hit skips the DB entirely
     try:
         current_user = get_or_create_user()
-        db.session.commit()
     except Exception as e:
         db.session.rollback()
         # Fallback to verify user creation
@@ -66,7 +179,15 @@ def get_related():
     data = request.json
     query = data.get('query', '')
     context_node_ids = data.get('context', [])
-    k_results = min(int(data.get('k', search_engine.config.RESULTS_TO_RETURN)), 100)
+    # Cheap bounded parse: no int() exception machinery on the hot path,
+    # and malformed k values fall back to the default instead of a 500
+    k_raw = data.get('k')
+    if isinstance(k_raw, int) and k_raw > 0:
+        k_results = min(k_raw, 100)
+    elif isinstance(k_raw, str) and k_raw.isdigit() and k_raw != '0':
+        k_results = min(int(k_raw), 100)
+    else:
+        k_results = search_engine.config.RESULTS_TO_RETURN
     ranking_mode = data.get('ranking', 'default')
     debug_mode = data.get('debug', False)
     is_private = data.get('private', False)
@@ -80,131 +201,202 @@ def get_related():
     search_start = time.time()
 
     # 3. Resolve Query Vector
+    # The encode runs on the engine's thread pool so the exclude-id lookup
+    # below overlaps with the model forward pass (both release the GIL).
+    search_text = query.replace('_', ' ')
+    encode_future = search_engine.executor.submit(search_engine.encode_query, search_text)
+
+    # 4. Exclude Exact Match from Results (Case Insensitive Fix)
+    # Derived from search_text so the query is cleaned exactly once per
+    # request. The startup-built reverse map resolves in one dict hit;
+    # the memoized SQL lookup remains for WE_SKIP_TITLE_MAP deployments.
+    clean_query = search_text.lower()
+    if search_engine.id_by_lookup is not None:
+        exclude_id = search_engine.id_by_lookup.get(clean_query, -1)
+    else:
+        exclude_id = _lookup_exclude_id(clean_query)
+
     try:
-        search_text = query.replace('_', ' ')
-        query_embedding = search_engine.model.encode(
-            [search_text], 
-            normalize_embeddings=True, 
-            convert_to_numpy=True
-        ).astype(np.float32)
+        query_embedding = encode_future.result()
     except Exception as e:
         console.log_error(str(e))
         return jsonify({"error": str(e)}), 500
 
-    # 4. Exclude Exact Match from Results (Case Insensitive Fix)
-    exclude_id = -1
-    clean_query = query.replace('_', ' ').lower()
-    
-    # Try case-insensitive match for the root node
-    cursor.execute("SELECT article_id FROM articles WHERE LOWER(title) = ?", (clean_query,))
-    row = cursor.fetchone()
-    if row:
-        exclude_id = int(row['article_id'])
-
     # 5. FAISS Search
     # We fetch extra candidates (pool size) because the verification step 
     # will aggressively drop mismatch "ghosts".
     pool_size = search_engine.config.CANDIDATE_POOL_SIZE
-    distances, indices = search_engine.index.search(query_embedding, pool_size)
+    # Routed through the engine's coalescing batcher: concurrent requests
+    # share one batched index.search call
+    distances, indices = search_engine.search(query_embedding, pool_size)
     
-    candidate_ids = []
-    raw_scores = {}
-    
-    for i, idx in enumerate(indices[0]):
-        idx_int = int(idx)
-        if idx_int >= 0 and idx_int != exclude_id:
-            candidate_ids.append(idx_int)
-            raw_scores[idx_int] = float(distances[0][i])
+    # Vectorized filter over the FAISS results (cf. cluster_routes); the
+    # raw-score map is only materialized when debug output needs it
+    ids = indices[0]
+    mask = (ids >= 0) & (ids != exclude_id)
+    # Meta pages drop here as one gather against the startup-built mask —
+    # no per-row is_meta_page call, and the SQL fetch below never pays row
+    # I/O for them
+    if search_engine.meta_mask is not None:
+        mm = search_engine.meta_mask
+        mask &= ~(mm[np.minimum(ids, mm.size - 1)] & (ids < mm.size))
+    candidate_ids = ids[mask].tolist()
+    raw_scores = dict(zip(candidate_ids, distances[0][mask].tolist())) if debug_mode else {}
 
     if not candidate_ids:
         console.log_error("No candidates found in FAISS")
         return jsonify({"results": [], "cross_edges": []})
 
     # 6. Fetch Metadata
-    placeholders = ','.join('?' * len(candidate_ids))
-    query_columns = ['article_id', 'title']
-    if search_engine.available_signals['pagerank']: query_columns.append('pagerank')
-    if search_engine.available_signals['pageviews']: query_columns.append('pageviews')
-    
-    sql = f"SELECT {', '.join(query_columns)} FROM articles WHERE article_id IN ({placeholders})"
-    cursor.execute(sql, candidate_ids)
-    rows = cursor.fetchall()
-    
+    # Column list is frozen on the engine at startup (raw signal columns
+    # only appear when no precomputed normalized column covers them)
+    query_columns = search_engine.related_columns
+    titles_map = search_engine.titles
+
+    candidates_to_verify = []
+    valid_ids, valid_pr, valid_pv = [], [], []
+
+    if titles_map is not None and len(query_columns) == 2:
+        # Everything the ranking needs is in RAM: titles from the startup
+        # map, signals from the normalized columns gathered below. The SQL
+        # round-trip disappears from the hot path; unknown ids just miss
+        # the map the way they'd miss the IN-list.
+        for cid in candidate_ids:
+            title = titles_map.get(cid)
+            if title is None: continue
+            candidates_to_verify.append(title)
+            valid_ids.append(cid)
+            valid_pr.append(0)
+            valid_pv.append(0)
+    else:
+        # Positional tuples instead of sqlite3.Row: skips the per-column
+        # name scan on every access across the whole candidate pool
+        padded_ids, placeholders = _padded_in(candidate_ids)
+        pr_col = query_columns.index('pagerank') if 'pagerank' in query_columns else -1
+        pv_col = query_columns.index('pageviews') if 'pageviews' in query_columns else -1
+
+        meta_cursor = search_engine.metadata_db.cursor()
+        meta_cursor.row_factory = None
+        sql = f"SELECT {', '.join(query_columns)} FROM articles WHERE article_id IN ({placeholders})"
+        meta_cursor.execute(sql, padded_ids)
+
+        # Per-row check only when the vectorized mask wasn't available above
+        check_meta = search_engine.meta_mask is None
+        for row in meta_cursor.fetchall():
+            title = row[1]
+            if check_meta and is_meta_page(title): continue
+            candidates_to_verify.append(title)
+            valid_ids.append(row[0])
+            valid_pr.append((row[pr_col] if pr_col >= 0 else 0) or 0)
+            valid_pv.append((row[pv_col] if pv_col >= 0 else 0) or 0)
+
     # ---------------------------------------------------------
     # 7. VERIFICATION LAYER (The Fix)
     # ---------------------------------------------------------
     # We re-encode the titles fetches from DB to ensure they actually match the query.
-    
-    candidates_to_verify = []
-    valid_rows = []
-    
-    for row in rows:
-        if is_meta_page(row['title']): continue
-        candidates_to_verify.append(row['title'])
-        valid_rows.append(row)
-        
-    # Batch encode titles (Fast for <1000 items)
+
+    # Title embeddings come from the precomputed store when built (a row
+    # gather instead of a transformer forward); otherwise batch encode with
+    # the LRU cache absorbing repeats across requests
     if candidates_to_verify:
-        title_embeddings = search_engine.model.encode(
-            candidates_to_verify, 
-            normalize_embeddings=True, 
-            convert_to_numpy=True
-        )
-        # Calculate cosine similarity: Query vs DB Titles
-        verification_scores = util.cos_sim(query_embedding, title_embeddings).cpu().numpy()[0]
+        title_embeddings = None
+        store = search_engine.title_embs
+        if store is not None:
+            emb_ids = np.asarray(valid_ids, dtype=np.int64)
+            # A stale store (built before newer articles) can't cover every
+            # id — bounds-check and fall back to encoding rather than let
+            # the gather raise on every request
+            if int(emb_ids.max()) < store.shape[0]:
+                title_embeddings = np.asarray(store[emb_ids], dtype=np.float32)
+        if title_embeddings is None:
+            title_embeddings = _encode_titles_cached(search_engine, candidates_to_verify)
+        # Calculate cosine similarity: Query vs DB Titles.
+        # Both sides are normalized, so this is a plain dot product — no
+        # torch tensor round-trip needed.
+        verification_scores = title_embeddings @ query_embedding[0]
     else:
         verification_scores = []
 
-    results = []
-    
-    for i, row in enumerate(valid_rows):
-        cid = row['article_id']
-        verified_semantic_score = float(verification_scores[i])
-        
-        # HARD FILTER: If the DB title doesn't semantically match the query, 
+    final_output = []
+    new_result_ids = []
+    kept_count = 0
+
+    if candidates_to_verify:
+        # HARD FILTER: If the DB title doesn't semantically match the query,
         # it is a mismatch artifact. DROP IT.
         # "Nesebar" vs "Eigenvalue" will be ~0.05.
-        if verified_semantic_score < 0.25:
-            continue
-
-        pagerank = row['pagerank'] if 'pagerank' in row.keys() else 0
-        pageviews = row['pageviews'] if 'pageviews' in row.keys() else 0
-        
-        # Use the VERIFIED score for ranking, not the FAISS score
-        final_score = calculate_multisignal_score(
-            semantic_similarity=verified_semantic_score, 
-            pagerank_score=pagerank, 
-            pageview_count=pageviews, 
-            title=row['title'], 
-            query=query
+        sem_arr = np.asarray(verification_scores, dtype=np.float32)
+        keep = np.flatnonzero(sem_arr >= 0.25)
+        kept_count = keep.size
+
+        kept_ids = [valid_ids[i] for i in keep]
+        kept_sem = sem_arr[keep]
+        titles = [candidates_to_verify[i] for i in keep]
+
+        # Normalized signals, chosen per signal: gather from the startup-
+        # built column when it loaded (every kept id has a metadata row, so
+        # it's within bounds), else normalize the raw fetched values — a
+        # partial _load_signal_columns failure must not zero out a signal
+        # that the SQL path did fetch
+        id_arr = np.asarray(kept_ids, dtype=np.int64)
+        if search_engine.pr_norm is not None:
+            pr_arr = search_engine.pr_norm[id_arr]
+        else:
+            pr_arr = normalize_pagerank_vec(np.array(valid_pr, dtype=np.float32)[keep])
+        if search_engine.pv_norm is not None:
+            pv_arr = search_engine.pv_norm[id_arr]
+        else:
+            pv_arr = normalize_pageviews_vec(np.array(valid_pv, dtype=np.float32)[keep])
+
+        # Use the VERIFIED scores for ranking, not the FAISS scores; one
+        # vectorized pass replaces a Python scoring call per candidate
+        # Title match runs on the spaced form: underscores would split
+        # the query into different words than the DB titles use
+        final_scores = calculate_multisignal_score_batch(
+            kept_sem, pr_arr, pv_arr, titles, search_text, normalized=True
         )
-        
-        result_obj = {
-            "id": cid,
-            "title": row['title'].replace(' ', '_'),
-            "score": int(final_score * 100),
-            "score_float": final_score
-        }
-        
-        if debug_mode:
-            result_obj['debug'] = {
-                'sem_faiss': raw_scores.get(cid, 0),
-                'sem_verify': verified_semantic_score,
-                'final': final_score
+
+        # Partial selection on the score array: partition out the top k,
+        # order just those, and only build dicts for rows that ship
+        k = min(k_results, final_scores.size)
+        if final_scores.size > k:
+            top_idx = np.argpartition(-final_scores, k - 1)[:k]
+            top_idx = top_idx[np.argsort(-final_scores[top_idx])]
+        else:
+            top_idx = np.argsort(-final_scores)
+
+        # Convert the shipped scores in one vectorized multiply + cast;
+        # tolist() yields plain Python numbers in a single C pass instead
+        # of a float() / int() boxing per element
+        ship_scores = (final_scores[top_idx] * 100).astype(np.int64).tolist()
+        debug_verify = kept_sem[top_idx].tolist() if debug_mode else None
+        debug_final = final_scores[top_idx].tolist() if debug_mode else None
+
+        # Build ship-ready dicts straight from the top-k rows: no
+        # score_float/id fields to strip later, ids ride in a parallel list
+        for j, i in enumerate(top_idx):
+            cid = kept_ids[i]
+
+            result_obj = {
+                "title": titles[i].replace(' ', '_'),
+                "score": ship_scores[j]
             }
-            
-        results.append(result_obj)
+
+            if debug_mode:
+                result_obj['debug'] = {
+                    'sem_faiss': raw_scores.get(cid, 0),
+                    'sem_verify': debug_verify[j],
+                    'final': debug_final[j]
+                }
+
+            new_result_ids.append(cid)
+            final_output.append(result_obj)
 
     # LOGGING
     search_end = time.time()
-    console.log_verification(len(candidate_ids), len(results), search_end - search_start)
+    console.log_verification(len(candidate_ids), kept_count, search_end - search_start)
 
-    # 8. Sort and Slice
-    results.sort(key=lambda x: x['score_float'], reverse=True)
-    top_results = results[:k_results]
-    
     # 9. Cross Edges
-    new_result_ids = [r['id'] for r in top_results]
     cross_edges = []
     
     if search_engine.can_reconstruct and len(new_result_ids) > 0:
@@ -216,46 +408,46 @@ def get_related():
                 else: pending_lookups.append(str(ctx).replace('_', ' ').lower())
             
             if pending_lookups:
-                ph = ','.join('?' * len(pending_lookups))
-                cursor.execute(f"SELECT article_id FROM articles WHERE LOWER(title) IN ({ph})", pending_lookups)
-                for r in cursor.fetchall(): context_ids_int.append(r['article_id'])
+                lookup_map = search_engine.id_by_lookup
+                if lookup_map is not None:
+                    for key in pending_lookups:
+                        aid = lookup_map.get(key)
+                        if aid is not None: context_ids_int.append(aid)
+                else:
+                    # Indexed probes on the pre-lowered column, not LOWER() scans
+                    ph = ','.join('?' * len(pending_lookups))
+                    cursor.execute(f"SELECT article_id FROM articles WHERE lookup_title IN ({ph})", pending_lookups)
+                    for r in cursor.fetchall(): context_ids_int.append(r['article_id'])
             
+            # No pre-dedup here: calculate_global_cross_edges runs its own
+            # single-pass int-cast + dedup (norm_ids) on both id lists, so
+            # the set()/list() rebuild was pure duplicated work
             cross_edges = calculate_global_cross_edges(
                 search_engine,
                 new_node_ids=new_result_ids,
-                existing_node_ids=list(set(context_ids_int)),
+                existing_node_ids=context_ids_int,
                 threshold=0.62,
                 user_context=current_user
             )
         except Exception as e:
             console.log_error(f"Cross edge error: {e}")
 
-    # 10. Analytics
+    # 10. Analytics — queued for the background writer; the client never
+    # needs the result, so the request skips the Postgres round-trip
     if not is_private:
-        try:
-            current_user.total_searches += 1
-            existing = PublicSearch.query.filter_by(search_query=query).first()
-            if existing:
-                existing.search_count += 1
-                existing.last_searched_at = datetime.utcnow()
-            else:
-                db.session.add(PublicSearch(
-                    search_query=query, 
-                    search_count=1, 
-                    last_ip=current_user.ip_address,
-                    ip_addresses=[current_user.ip_address],
-                    user_agents=[current_user.user_agent]
-                ))
-            db.session.commit()
-        except:
-            db.session.rollback()
-
-    final_output = []
-    for r in top_results:
-        final_output.append({k: v for k, v in r.items() if k not in ['score_float', 'id']})
+        # Keyed on the spaced form, matching what the encoder and ranking
+        # see, so underscore/space variants merge into one analytics row
+        analytics.record_search(
+            search_text,
+            current_user.ip_address,
+            current_user.user_agent,
+            current_user.fingerprint
+        )
 
     console.log_success(f"Sending {len(final_output)} nodes + {len(cross_edges)} edges")
-    return jsonify({
+    # Graph payloads run tens of KB; orjson serialization is several times
+    # faster than the stdlib json behind jsonify
+    return json_response({
         "results": final_output,
         "cross_edges": cross_edges
     })
\ No newline at end of file
@@ -0,0 +1,18 @@
+"""
+Gunicorn entrypoint. The dev server (python app.py) is one process with
+the GIL arbitrating every encode; gunicorn with preload_app loads the
+FAISS index, model and metadata structures once in the master and forks
+workers that share those pages copy-on-write, so per-worker RSS stays
+flat.
+
+Always launch through gunicorn.conf.py — its post_fork hook restarts the
+background threads and disposes the inherited DB pool, none of which
+survive fork(). Set WE_WEB_WORKERS to size both the worker count and the
+engine's per-process thread pinning:
+
+    WE_WEB_WORKERS=4 gunicorn -c gunicorn.conf.py wsgi:app
+"""
+from app import app
+
+if __name__ == "__main__":
+    app.run()
@@ -0,0 +1,77 @@
+"""
+Rebuilds the search index as IVF-PQ with 8-bit codes.
+
+The per-request search scan is memory-bound on vector bytes; PQ stores one
+byte per subquantizer instead of 4 bytes per dimension, cutting DRAM
+traffic ~6x for 384-dim vectors (64 codes vs 1536 bytes) and letting FAISS
+use its SIMD code-scan kernels. Recall is tunable at query time via nprobe
+(the backend sets 32); run scripts/test_search.py against both indexes
+before swapping the file in.
+
+Vectors are pulled from the existing index, so article ids stay the
+sequential positions the routes rely on. Cross-edge reconstruction keeps
+working through the direct map, but reconstructed vectors are PQ
+approximations — keep the mmap'd vector store (build_vector_store.py) as
+the exact-vector source alongside a PQ index.
+
+Run on the server:
+    python scripts/build_ivfpq_index.py [--out PATH] [--factory IVF4096,PQ64x8]
+"""
+import sys
+import os
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+from config import Config
+
+CHUNK = 100_000
+TRAIN_SAMPLE = 400_000
+
+def _arg(flag, default):
+    if flag in sys.argv:
+        return sys.argv[sys.argv.index(flag) + 1]
+    return default
+
+def main():
+    config = Config()
+    factory = _arg('--factory', 'IVF4096,PQ64x8')
+    out_path = _arg('--out', config.INDEX_PATH + '.ivfpq')
+
+    print(f"Loading source index from {config.INDEX_PATH}...")
+    source = faiss.read_index(config.INDEX_PATH)
+    base = source.index if hasattr(source, 'index') else source
+    ivf = faiss.downcast_index(base)
+    if hasattr(ivf, 'make_direct_map'):
+        ivf.make_direct_map()
+
+    n, d = source.ntotal, source.d
+    print(f"Building {factory} over {n} x {d} vectors...")
+    index = faiss.index_factory(d, factory, faiss.METRIC_INNER_PRODUCT)
+
+    # Train on a uniform sample; normalize so inner product stays cosine
+    sample_size = min(TRAIN_SAMPLE, n)
+    step = max(1, n // sample_size)
+    train = np.empty((len(range(0, n, step)), d), dtype=np.float32)
+    for row, i in enumerate(range(0, n, step)):
+        source.reconstruct(i, train[row])
+    faiss.normalize_L2(train)
+    print(f"Training on {train.shape[0]} vectors...")
+    index.train(train)
+
+    buf = np.empty((CHUNK, d), dtype=np.float32)
+    for start in range(0, n, CHUNK):
+        count = min(CHUNK, n - start)
+        chunk = buf[:count]
+        source.reconstruct_n(start, count, chunk)
+        faiss.normalize_L2(chunk)
+        index.add(chunk)
+        print(f"  {start + count}/{n}")
+
+    print(f"Writing {out_path}...")
+    faiss.write_index(index, out_path)
+    print("✓ IVF-PQ index written — point INDEX_PATH at it after validating recall")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Precomputes title-only embeddings for every article into a raw mmap-able
+float32 file, row-indexed by article_id.
+
+/related's verification layer compares each candidate's *title* embedding
+against the query — the index vectors can't stand in for that, since they
+embed article content and the whole point of verification is catching rows
+where content and title diverge. With this file present, the per-request
+title encode becomes a row gather plus one GEMV; without it the backend
+falls back to encode-on-miss with an in-process LRU.
+
+Run on the server whenever the metadata DB changes:
+    python scripts/build_title_embeddings.py [--fp16]
+"""
+import sys
+import os
+import sqlite3
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+from config import Config
+
+BATCH = 2048
+
+def main():
+    use_fp16 = '--fp16' in sys.argv
+    dtype = np.float16 if use_fp16 else np.float32
+
+    config = Config()
+    conn = sqlite3.connect(config.METADATA_PATH)
+    cursor = conn.cursor()
+    cursor.execute("SELECT MAX(article_id) FROM articles")
+    max_id = cursor.fetchone()[0]
+    if max_id is None:
+        print("No articles in metadata DB")
+        return
+
+    print("Loading model...")
+    model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+    model.max_seq_length = 64
+    d = model.get_sentence_embedding_dimension()
+
+    # The extension records the dtype (.f32/.f16) — the loader maps the
+    # file by extension instead of guessing from its size
+    out_path = os.path.splitext(config.TITLE_EMB_PATH)[0] + ('.f16' if use_fp16 else '.f32')
+
+    n = max_id + 1
+    print(f"Encoding {n} title rows ({d} dims, {np.dtype(dtype).name}) to {out_path}...")
+    out = np.memmap(out_path, dtype=dtype, mode='w+', shape=(n, d))
+
+    cursor.execute("SELECT article_id, title FROM articles ORDER BY article_id")
+    done = 0
+    while True:
+        rows = cursor.fetchmany(BATCH)
+        if not rows:
+            break
+        ids = [r[0] for r in rows]
+        embs = model.encode(
+            [r[1] for r in rows],
+            batch_size=256,
+            normalize_embeddings=True,
+            convert_to_numpy=True
+        ).astype(np.float32)
+        out[ids] = embs
+        done += len(rows)
+        print(f"  {done} titles encoded")
+
+    out.flush()
+    print("✓ Title embedding store written")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Dumps the FAISS index vectors to a raw mmap-able float32 file.
+
+The backend maps this file at startup (SearchEngine._load_vector_store) so
+cross-edge calculations read vectors straight from the page cache instead of
+going through FAISS's reconstruct/decode path. Vectors are L2-normalized on
+disk so downstream dot products are exactly cosine similarity.
+
+Run on the server after (re)building the index:
+    python scripts/build_vector_store.py [--fp16]
+
+--fp16 stores half-precision vectors: half the bytes per fetch, and the
+cosine error (~1e-3) is far below the 0.62 edge threshold. The backend
+infers the dtype from the file size and upcasts to float32 after the
+row gather.
+"""
+import sys
+import os
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+from config import Config
+
+CHUNK = 100_000
+
+def main():
+    use_fp16 = '--fp16' in sys.argv
+    dtype = np.float16 if use_fp16 else np.float32
+
+    config = Config()
+    print(f"Loading index from {config.INDEX_PATH}...")
+    index = faiss.read_index(config.INDEX_PATH)
+
+    base = index.index if hasattr(index, 'index') else index
+    ivf = faiss.downcast_index(base)
+    if hasattr(ivf, 'make_direct_map'):
+        ivf.make_direct_map()
+
+    n, d = index.ntotal, index.d
+    print(f"Dumping {n} x {d} {np.dtype(dtype).name} vectors to {config.VECTORS_PATH}...")
+
+    out = np.memmap(config.VECTORS_PATH, dtype=dtype, mode='w+', shape=(n, d))
+    buf = np.empty((CHUNK, d), dtype=np.float32)
+    for start in range(0, n, CHUNK):
+        count = min(CHUNK, n - start)
+        chunk = buf[:count]
+        index.reconstruct_n(start, count, chunk)
+        faiss.normalize_L2(chunk)
+        out[start:start + count] = chunk
+        print(f"  {start + count}/{n}")
+
+    out.flush()
+    print("✓ Vector store written")
+
+if __name__ == "__main__":
+    main()
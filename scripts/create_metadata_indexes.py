@@ -0,0 +1,40 @@
+"""
+One-off index setup for the SQLite metadata DB.
+
+The candidate fetch selects (article_id, title, pagerank, pageviews,
+lookup_title) by id; the covering index below makes that an index-only
+scan with no main-table page reads. The title/lookup_title indexes back
+the root-resolution lookups.
+
+Run on the server after (re)building metadata.db:
+    python scripts/create_metadata_indexes.py
+"""
+import sys
+import os
+import sqlite3
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+from config import Config
+
+DDL = [
+    "CREATE INDEX IF NOT EXISTS idx_articles_cover ON articles(article_id, title, pagerank, pageviews, lookup_title)",
+    "CREATE INDEX IF NOT EXISTS idx_articles_title ON articles(title)",
+    "CREATE INDEX IF NOT EXISTS idx_articles_lookup_title ON articles(lookup_title)",
+]
+
+def main():
+    config = Config()
+    print(f"Opening {config.METADATA_PATH}...")
+    conn = sqlite3.connect(config.METADATA_PATH)
+
+    for ddl in DDL:
+        print(f"  {ddl.split('idx_')[1].split(' ')[0]}...")
+        conn.execute(ddl)
+
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+    print("✓ Indexes created")
+
+if __name__ == "__main__":
+    main()